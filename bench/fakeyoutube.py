@@ -0,0 +1,278 @@
+"""
+A local stand-in for YouTube, used by the benchmarks to run the download pipeline offline.
+
+It serves the watch page, get_video_info response and player base.js of fake videos (synthetic,
+or recorded from real videos with record.py), and media files (synthetic bytes, or real media
+files generated with ffmpeg so that they can be merged and converted). install() redirects
+every request made with urllib (by pytube and by the app) to the server.
+"""
+
+import http.server
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+# Player script with a minimal signature cipher, in the format pytube parses
+PLAYER_JS = (
+    'var Xy={ab:function(a,b){a.splice(0,b)},\n'
+    'cd:function(a){a.reverse()},\n'
+    'ef:function(a,b){var c=a[0];a[0]=a[b%a.length];a[b%a.length]=c}};\n'
+    'Wz=function(a){a=a.split("");Xy.cd(a,0);Xy.ab(a,2);Xy.ef(a,5);return a.join("")};\n'
+    'c&&d.set(b,encodeURIComponent(Wz(e)));\n'
+)
+PLAYER_PATH = "/s/player/bench0000/player_ias.vflset/en_US/base.js"
+
+# Streams of a synthetic video: itag -> (mime type, kind, share of the video size)
+STREAMS = {
+    18: ('video/mp4; codecs="avc1.42001E, mp4a.40.2"', "progressive", 0.3),
+    22: ('video/mp4; codecs="avc1.64001F, mp4a.40.2"', "progressive", 0.6),
+    137: ('video/mp4; codecs="avc1.640028"', "video", 1.0),
+    136: ('video/mp4; codecs="avc1.4d401f"', "video", 0.5),
+    140: ('audio/mp4; codecs="mp4a.40.2"', "audio", 0.12),
+}
+QUALITIES = {18: "medium", 22: "hd720", 137: "hd1080", 136: "hd720", 140: "tiny"}
+# Size of the block of random bytes repeated to build synthetic media
+BLOCK_SIZE = 1024 * 1024
+
+
+def synthetic_video(video_id, size, length=60):
+    """The description of a fake video whose largest video stream has size bytes"""
+    return {"video_id": video_id, "title": f"Benchmark video {video_id}", "length": length,
+            "streams": {itag: max(1, int(size * share)) for itag, (_, _, share) in STREAMS.items()}}
+
+
+class FakeYouTube():
+    """
+    The server. Videos are added with add_video (synthetic) or add_recording (recorded pages).
+    Every response can be delayed by latency seconds, and media can be served at a limited rate.
+    """
+
+    def __init__(self, latency=0.0, rate=None):
+        self.latency = latency  # Delay before each page response, in seconds
+        self.rate = rate  # Media bandwidth in bytes/s, None for no limit
+        self.videos = {}  # Video id -> description
+        self.pages = {}  # (path, video id) -> recorded page
+        self.media = {}  # (video id, itag) -> path of a real media file
+        self.block = os.urandom(BLOCK_SIZE)
+        self.requests = 0  # Number of requests served
+        self.lock = threading.Lock()
+        self.server = None
+        self.media_dir = None
+
+    @property
+    def address(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        fake = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                fake.handle(self, head=True)
+
+            def do_GET(self):
+                fake.handle(self, head=False)
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.media_dir is not None:
+            shutil.rmtree(self.media_dir, ignore_errors=True)
+
+    def add_video(self, video):
+        self.videos[video["video_id"]] = video
+
+    def add_recording(self, path):
+        """Adds a video recorded by record.py"""
+        with open(path, "r") as file:
+            recording = json.load(file)
+        video_id = recording["video_id"]
+        for page in ("watch", "get_video_info"):
+            self.pages[(page, video_id)] = recording[page]
+        self.pages[("js", recording["js_path"])] = recording["js"]
+        self.videos[video_id] = {"video_id": video_id, "title": recording["title"], "length": recording["length"],
+                                 "streams": {int(itag): size for itag, size in recording["streams"].items()}}
+        return video_id
+
+    def generate_media(self, ffmpeg="ffmpeg"):
+        """Replaces the synthetic bytes by real media files (testsrc video, sine audio) so that ffmpeg can process them"""
+        self.media_dir = tempfile.mkdtemp(prefix="ytgui-bench-")
+        for video_id, video in self.videos.items():
+            video_source = ["-f", "lavfi", "-i", f"testsrc=duration={video['length']}:size=1280x720:rate=30"]
+            audio_source = ["-f", "lavfi", "-i", f"sine=duration={video['length']}"]
+            for itag in video["streams"]:
+                kind = STREAMS[itag][1] if itag in STREAMS else "audio"
+                if kind == "progressive":
+                    args = video_source + audio_source + ["-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac"]
+                elif kind == "video":
+                    args = video_source + ["-c:v", "libx264", "-preset", "ultrafast"]
+                else:
+                    args = audio_source + ["-c:a", "aac"]
+                path = os.path.join(self.media_dir, f"{video_id}-{itag}.mp4")
+                subprocess.run([ffmpeg, "-hide_banner", "-loglevel", "error", "-y"] + args + ["-f", "mp4", path], check=True)
+                self.media[(video_id, itag)] = path
+                video["streams"][itag] = os.path.getsize(path)
+
+    ## Responses
+
+    def watch_page(self, video):
+        player_response = {"playabilityStatus": {"status": "OK"},
+                           "videoDetails": {"videoId": video["video_id"], "title": video["title"],
+                                            "lengthSeconds": str(video["length"])}}
+        return ("<html><head></head><body><script>"
+                f"var ytInitialPlayerResponse = {json.dumps(player_response)};"
+                "var ytInitialData = {};"
+                f'</script><script src="{PLAYER_PATH}"></script></body></html>')
+
+    def video_info(self, video):
+        formats = []
+        adaptive = []
+        expire = int(time.time()) + 6 * 3600
+        for itag, size in video["streams"].items():
+            mime_type, kind, _ = STREAMS.get(itag, ('audio/mp4; codecs="mp4a.40.2"', "audio", 0))
+            url = (f"https://rr1---sn-bench.googlevideo.com/videoplayback?expire={expire}&id={video['video_id']}"
+                   f"&itag={itag}&clen={size}&signature=bench")
+            entry = {"itag": itag, "url": url, "mimeType": mime_type, "quality": QUALITIES.get(itag, "tiny"),
+                     "bitrate": int(size * 8 / max(1, video["length"])), "contentLength": str(size)}
+            (formats if kind == "progressive" else adaptive).append(entry)
+        player_response = {"playabilityStatus": {"status": "OK"},
+                           "streamingData": {"formats": formats, "adaptiveFormats": adaptive},
+                           "videoDetails": {"videoId": video["video_id"], "title": video["title"],
+                                            "lengthSeconds": str(video["length"])}}
+        return urllib.parse.urlencode({"status": "ok", "player_response": json.dumps(player_response)})
+
+    def handle(self, request, head):
+        with self.lock:
+            self.requests += 1
+        parsed = urllib.parse.urlparse(request.path)
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        path = parsed.path
+        try:
+            if path.endswith("/videoplayback"):
+                return self.send_media(request, query, head)
+            time.sleep(self.latency)
+            if path.endswith("/watch"):
+                video_id = query["v"]
+                body = self.pages.get(("watch", video_id)) or self.watch_page(self.videos[video_id])
+            elif path.endswith("/get_video_info"):
+                video_id = query["video_id"]
+                body = self.pages.get(("get_video_info", video_id)) or self.video_info(self.videos[video_id])
+            elif path.endswith("base.js"):
+                body = self.pages.get(("js", path), PLAYER_JS)
+            else:
+                raise KeyError(path)
+        except (KeyError, ValueError):
+            request.send_response(404)
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+            return
+        data = body.encode("utf-8")
+        request.send_response(200)
+        request.send_header("Content-Type", "text/html; charset=utf-8")
+        request.send_header("Content-Length", str(len(data)))
+        request.end_headers()
+        if not head:
+            request.wfile.write(data)
+
+    def send_media(self, request, query, head):
+        video_id, itag = query.get("id"), int(query["itag"])
+        if video_id in self.videos:
+            size = self.videos[video_id]["streams"][itag]
+        else:
+            size = int(query["clen"])  # A recorded stream url, served as synthetic bytes
+        start, end = 0, size - 1
+        match = re.match(r"bytes=(\d+)-(\d*)", request.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            request.send_response(206)
+            request.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            request.send_response(200)
+        request.send_header("Content-Type", "video/mp4")
+        request.send_header("Content-Length", str(end - start + 1))
+        request.end_headers()
+        if head:
+            return
+        path = self.media.get((video_id, itag))
+        try:
+            if path is not None:
+                with open(path, "rb") as file:
+                    file.seek(start)
+                    self.write_limited(request, lambda n: file.read(n), end - start + 1)
+            else:
+                position = start
+
+                def read(n):
+                    nonlocal position
+                    offset = position % BLOCK_SIZE
+                    data = self.block[offset:offset + n]
+                    position += len(data)
+                    return data
+                self.write_limited(request, read, end - start + 1)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client stopped reading
+
+    def write_limited(self, request, read, length):
+        """Writes length bytes from read, at most self.rate bytes per second"""
+        started = time.perf_counter()
+        sent = 0
+        while sent < length:
+            data = read(min(64 * 1024, length - sent))
+            if not data:
+                break
+            request.wfile.write(data)
+            sent += len(data)
+            if self.rate:
+                delay = sent / self.rate - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+
+class RedirectHandler(urllib.request.BaseHandler):
+    """Sends every http(s) request made with urllib to the fake server instead"""
+
+    handler_order = 100  # Before the default handlers
+
+    def __init__(self, address):
+        self.address = address
+
+    def rewrite(self, request):
+        parsed = urllib.parse.urlparse(request.full_url)
+        request.full_url = self.address + parsed.path + ("?" + parsed.query if parsed.query else "")
+        return request
+
+    http_request = rewrite
+    https_request = rewrite
+
+
+def install(fake):
+    """
+    Redirects the requests made with urllib.request.urlopen (pytube and the app) to the fake server,
+    through the app's shared HTTP client so that its connection pool is measured as well
+    """
+    from httppool import client
+    client.install(RedirectHandler(fake.address))
+
+
+def uninstall():
+    from httppool import client
+    client.uninstall()
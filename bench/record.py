@@ -0,0 +1,48 @@
+"""
+Records the pages pytube fetches to resolve a real video (watch page, get_video_info, player
+base.js), so that the benchmarks can replay them with the fake server (run.py --recordings DIR).
+The media itself is not recorded: the fake server serves synthetic bytes of the same size.
+
+Usage: python bench/record.py DIR URL [URL ...]
+"""
+
+import json
+import os
+import sys
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from streams import known_filesize
+
+
+def record(url, directory):
+    import pytube
+    youtube = pytube.YouTube(url, defer_prefetch_init=True)
+    youtube.prefetch()
+    youtube.descramble()
+    streams = {}
+    for stream in youtube.streams:
+        streams[stream.itag] = known_filesize(stream) or stream.filesize
+    recording = {"video_id": youtube.video_id, "title": youtube.title, "length": youtube.length,
+                 "watch": youtube.watch_html, "get_video_info": youtube.vid_info_raw,
+                 "js_path": urllib.parse.urlparse(youtube.js_url).path, "js": youtube.js, "streams": streams}
+    path = os.path.join(directory, f"{youtube.video_id}.json")
+    with open(path, "w") as file:
+        json.dump(recording, file)
+    return path
+
+
+def main(argv):
+    if len(argv) < 2:
+        print(__doc__.strip().splitlines()[-1], file=sys.stderr)
+        return 2
+    directory = argv[0]
+    os.makedirs(directory, exist_ok=True)
+    for url in argv[1:]:
+        print(record(url, directory))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
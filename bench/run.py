@@ -0,0 +1,338 @@
+"""
+Offline benchmarks of the download pipeline (load_url -> download_video / download_audio -> ffmpeg),
+run against the local fake YouTube server of fakeyoutube.py.
+
+Every scenario loads and downloads the same videos with a fresh DownloadEngine, configured with
+its own settings, and reports:
+- resolve latency (pytube round-trips) and load latency (url queued -> item loaded)
+- transfer throughput (bytes/s over all the streams, and per stream)
+- merge / convert / streaming mux time (ffmpeg)
+- GUI-update overhead (time spent publishing progress, and applying it at each refresh)
+
+Results are written as JSON (--output) so that runs can be compared (--compare).
+
+Usage: python bench/run.py [--videos N] [--size MB] [--scenarios progressive,segmented,...] [--output FILE]
+"""
+
+import argparse
+import json
+import os
+import platform
+import queue
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, os.pardir, "src"))
+
+import fakeyoutube
+from engine import DownloadEngine
+from manifest import ManifestCache
+from dedup import DedupIndex
+
+# Interval between two refreshes of the simulated GUI, in seconds (UI_REFRESH_INTERVAL of the GUI)
+REFRESH_INTERVAL = 0.066
+
+# Settings of each scenario, over the defaults of src/settings.json. "ffmpeg" scenarios need the ffmpeg binary.
+SCENARIOS = {
+    "progressive": {"progressive_stream": True, "segmented_download": False, "resume_downloads": False},
+    "resumable": {"progressive_stream": True, "segmented_download": False, "resume_downloads": True},
+    "segmented": {"progressive_stream": True, "segmented_download": True, "resume_downloads": True, "connections": 4},
+    "cached": {"progressive_stream": True, "segmented_download": False, "resume_downloads": True, "warm_cache": True},
+    "adaptive": {"progressive_stream": False, "streaming_mux": False, "ffmpeg": True},
+    "streaming_mux": {"progressive_stream": False, "streaming_mux": True, "ffmpeg": True},
+    "audio": {"only_audio": True, "convert_audio": True, "streaming_mux": False, "ffmpeg": True},
+}
+
+
+def summary(values, scale=1000):
+    """Count, mean, median, 95th percentile and maximum of a list of durations (in ms by default)"""
+    if not values:
+        return None
+    values = sorted(v * scale for v in values)
+    return {"count": len(values), "mean": round(statistics.mean(values), 3), "p50": round(values[len(values) // 2], 3),
+            "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3), "max": round(values[-1], 3)}
+
+
+class Probe():
+    """Wraps methods of an engine to time the stages of the pipeline"""
+
+    def __init__(self, engine):
+        self.resolves = []  # Duration of each pytube resolution
+        self.transfers = []  # (start, end, bytes) of each stream transfer
+        self.ffmpeg = {}  # Status of the ffmpeg step -> durations
+        self.callbacks = []  # Duration of each progress callback
+        self.wrap(engine, "resolve", self.on_resolve)
+        self.wrap(engine, "fetch_stream", self.on_fetch)
+        self.wrap(engine, "run_ffmpeg", self.on_ffmpeg)
+        self.wrap(engine, "ffmpeg_stream", self.on_ffmpeg_stream)
+        self.wrap(engine, "progress_callback", self.on_callback)
+
+    @staticmethod
+    def wrap(engine, name, probe):
+        method = getattr(engine, name)
+        setattr(engine, name, lambda *args, **kwargs: probe(method, *args, **kwargs))
+
+    @staticmethod
+    def timed(method, *args, **kwargs):
+        start = time.perf_counter()
+        result = method(*args, **kwargs)
+        return result, start, time.perf_counter()
+
+    def on_resolve(self, method, *args, **kwargs):
+        result, start, end = self.timed(method, *args, **kwargs)
+        self.resolves.append(end - start)
+        return result
+
+    def on_fetch(self, method, stream, *args, **kwargs):
+        result, start, end = self.timed(method, stream, *args, **kwargs)
+        self.transfers.append((start, end, stream.filesize))
+        return result
+
+    async def on_ffmpeg(self, method, command, duration, vid, status=None):
+        start = time.perf_counter()
+        result = await method(command, duration, vid, status)
+        self.ffmpeg.setdefault(status or "ffmpeg", []).append(time.perf_counter() - start)
+        return result
+
+    def on_ffmpeg_stream(self, method, command, inputs, outpath, vid, status=None):
+        result, start, end = self.timed(method, command, inputs, outpath, vid, status)
+        self.ffmpeg.setdefault(status or "ffmpeg", []).append(end - start)
+        return result
+
+    def on_callback(self, method, *args):
+        result, start, end = self.timed(method, *args)
+        self.callbacks.append(end - start)
+        return result
+
+
+class Driver():
+    """Runs an engine to completion from the main thread, like the GUI would, and times the refreshes"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.calls = queue.Queue()
+        engine.call_after = lambda function, *args: self.calls.put((function, args))
+        engine.on_url_loaded = self.on_url_loaded
+        engine.on_url_failed = lambda vid: None
+        engine.on_videos_found = engine.add_videos
+        self.download = True  # Start the download of the loaded items
+        self.queued = {}  # Item id -> time its url was queued
+        self.loads = []  # Latency between queuing an url and the item being loaded
+        self.refreshes = []  # Duration of each refresh (drain the progress bus and apply it)
+        self.updates = 0  # Number of row updates applied
+        self.table = {}  # The simulated view: item id -> columns
+
+    def on_url_loaded(self, vid):
+        self.loads.append(time.perf_counter() - self.queued[vid.id])
+        vid.loaded = True
+        if self.download:
+            self.engine.start_download(vid)
+
+    def refresh(self):
+        start = time.perf_counter()
+        updates, message = self.engine.bus.drain()
+        for vid_id, columns in updates.items():
+            self.table.setdefault(vid_id, {}).update(columns)
+        self.updates += len(updates)
+        self.refreshes.append(time.perf_counter() - start)
+
+    def run(self, urls):
+        start = time.perf_counter()
+        for vid in self.engine.add_urls(urls):
+            self.queued[vid.id] = start
+        next_refresh = start + REFRESH_INTERVAL
+        while True:
+            try:
+                function, args = self.calls.get(timeout=max(0.0, next_refresh - time.perf_counter()))
+                function(*args)
+            except queue.Empty:
+                pass
+            if time.perf_counter() >= next_refresh:
+                self.refresh()
+                next_refresh += REFRESH_INTERVAL
+                if self.calls.empty() and not self.engine.busy():
+                    break
+        self.refresh()
+        return time.perf_counter() - start
+
+
+def make_engine(workdir, settings):
+    """A fresh engine with its own settings file, save directory, manifest cache and dedup index"""
+    with open(os.path.join(BENCH_DIR, os.pardir, "src", "settings.json"), "r") as file:
+        values = json.load(file)
+    values.update({key: value for key, value in settings.items() if key not in ("ffmpeg", "warm_cache")})
+    values["save_path"] = os.path.join(workdir, "downloads")
+    values["create_dir"] = True
+    values["quality_preset"] = ""
+    os.makedirs(values["save_path"], exist_ok=True)
+    settings_path = os.path.join(workdir, "settings.json")
+    with open(settings_path, "w") as file:
+        json.dump(values, file)
+    engine = DownloadEngine(None, settings_path)
+    engine.manifests = ManifestCache(os.path.join(workdir, "manifests"), engine.manifest_cache_ttl * 3600,
+                                     engine.manifest_cache_size)
+    engine.dedup_index = DedupIndex(os.path.join(workdir, "dedup.jsonl"))
+    return engine
+
+
+def run_scenario(name, settings, urls, workers):
+    workdir = tempfile.mkdtemp(prefix=f"ytgui-bench-{name}-")
+    engines = []  # Closed at the end of the scenario, with their threads
+    try:
+        if settings.get("warm_cache"):
+            warmup = Driver(make_engine(workdir, settings))
+            engines.append(warmup.engine)
+            warmup.download = False
+            warmup.run(urls)
+        engine = make_engine(workdir, settings)
+        engines.append(engine)
+        engine.scheduler.set_limit(workers)
+        probe = Probe(engine)
+        driver = Driver(engine)
+        http_before = engine.http.stats()
+        wall = driver.run(urls)
+        http_after = engine.http.stats()
+        http = {key: http_after[key] - http_before[key] for key in ("requests", "reused", "opened", "retried", "waits")}
+        http["wait_ms"] = round((http_after["wait_seconds"] - http_before["wait_seconds"]) * 1000, 3)
+        http["reuse_rate"] = round(http["reused"] / http["requests"], 3) if http["requests"] else None
+
+        failed = sum(1 for vid in engine.queue if vid.error or not vid.completed)
+        transferred = sum(size for _, _, size in probe.transfers)
+        if probe.transfers:
+            span = max(end for _, end, _ in probe.transfers) - min(start for start, _, _ in probe.transfers)
+        else:
+            span = 0
+        rates = [size / (end - start) for start, end, size in probe.transfers if end > start]
+        return {
+            "items": len(engine.queue), "failed": failed, "wall_s": round(wall, 3),
+            "resolve_ms": summary(probe.resolves),
+            "load_ms": summary(driver.loads),
+            "transfer": {"bytes": transferred, "streams": len(probe.transfers),
+                         "bytes_per_s": round(transferred / span) if span else None,
+                         "stream_bytes_per_s": summary(rates, scale=1)},
+            "ffmpeg_ms": {status: summary(durations) for status, durations in probe.ffmpeg.items()},
+            "http": http,
+            "gui": {"progress_callbacks": len(probe.callbacks),
+                    "callback_us": summary(probe.callbacks, scale=1000000),
+                    "refreshes": len(driver.refreshes), "row_updates": driver.updates,
+                    "refresh_us": summary(driver.refreshes, scale=1000000)},
+        }
+    finally:
+        for engine in engines:
+            engine.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def metadata(args, ffmpeg):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    try:
+        import pytube
+        pytube_version = pytube.__version__
+    except ImportError:
+        pytube_version = None
+    return {"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "python": platform.python_version(),
+            "platform": platform.platform(), "pytube": pytube_version, "ffmpeg": ffmpeg,
+            "videos": args.videos, "size_mb": args.size, "length_s": args.length, "latency_ms": args.latency,
+            "rate_mbps": args.rate, "workers": args.workers, "recordings": args.recordings}
+
+
+# Metrics shown by --compare: (label, path in a scenario result, True if higher is better)
+COMPARED = [("resolve mean ms", ("resolve_ms", "mean"), False), ("load p95 ms", ("load_ms", "p95"), False),
+            ("bytes/s", ("transfer", "bytes_per_s"), True), ("wall s", ("wall_s",), False),
+            ("callback mean us", ("gui", "callback_us", "mean"), False), ("refresh mean us", ("gui", "refresh_us", "mean"), False)]
+
+
+def lookup(result, path):
+    for key in path:
+        if not isinstance(result, dict):
+            return None
+        result = result.get(key)
+    return result
+
+
+def compare(previous, current):
+    """Prints the change of the main metrics between two runs"""
+    for name, result in current["scenarios"].items():
+        old = previous.get("scenarios", {}).get(name)
+        if not old or "skipped" in result:
+            continue
+        for label, path, higher_is_better in COMPARED:
+            before, after = lookup(old, path), lookup(result, path)
+            if before and after is not None:
+                change = (after - before) / before * 100
+                better = (change > 0) == higher_is_better
+                print(f"{name:14} {label:18} {before:>14} -> {after:>14} ({change:+.1f}%{'' if abs(change) < 5 else ' better' if better else ' worse'})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the download pipeline.")
+    parser.add_argument("--videos", type=int, default=5, help="number of videos per scenario")
+    parser.add_argument("--size", type=float, default=8, help="size of the largest stream of each synthetic video, in MB")
+    parser.add_argument("--length", type=int, default=10, help="duration of each synthetic video, in seconds")
+    parser.add_argument("--latency", type=float, default=20, help="latency of the fake YouTube pages, in ms")
+    parser.add_argument("--rate", type=float, help="bandwidth limit of the fake media server, in MB/s")
+    parser.add_argument("--workers", type=int, default=3, help="number of simultaneous downloads")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated list of scenarios")
+    parser.add_argument("--recordings", metavar="DIR", help="replay the videos recorded by record.py in DIR instead")
+    parser.add_argument("--output", metavar="FILE", help="write the results to FILE (JSON)")
+    parser.add_argument("--compare", metavar="FILE", help="compare the results with a previous run")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        print(f"Unknown scenario(s): {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    ffmpeg = shutil.which("ffmpeg")
+
+    fake = fakeyoutube.FakeYouTube(latency=args.latency / 1000, rate=args.rate * 1000000 if args.rate else None).start()
+    if args.recordings:
+        ids = [fake.add_recording(os.path.join(args.recordings, name))
+               for name in sorted(os.listdir(args.recordings)) if name.endswith(".json")]
+    else:
+        ids = [f"bench{index:06d}" for index in range(args.videos)]
+        for video_id in ids:
+            fake.add_video(fakeyoutube.synthetic_video(video_id, int(args.size * 1000000), args.length))
+        if ffmpeg:
+            fake.generate_media(ffmpeg)
+    fakeyoutube.install(fake)
+    urls = [f"https://www.youtube.com/watch?v={video_id}" for video_id in ids]
+
+    results = {"meta": metadata(args, ffmpeg), "scenarios": {}}
+    try:
+        for name in names:
+            settings = SCENARIOS[name]
+            if settings.get("ffmpeg") and not ffmpeg:
+                results["scenarios"][name] = {"skipped": "ffmpeg not found"}
+            else:
+                results["scenarios"][name] = run_scenario(name, settings, urls, args.workers)
+            print(f"{name}: {json.dumps(results['scenarios'][name])}", file=sys.stderr)
+    finally:
+        fakeyoutube.uninstall()
+        fake.stop()
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
+    else:
+        print(json.dumps(results, indent=4))
+    if args.compare:
+        with open(args.compare, "r") as file:
+            compare(json.load(file), results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Startup budget of the batch mode: imports the modules app.py --batch imports and creates the
+engine in fresh interpreters, and fails if the best of the runs is over the budget, or if the slow
+modules that are only imported on first use (pytube, ffmpeg-python, wxWidgets) have been imported.
+
+Usage: python bench/startup.py [--runs N] [--import-budget MS] [--engine-budget MS]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, os.pardir, "src")
+
+# Modules that must not be imported before they are used (see startup.py)
+LAZY_MODULES = ("pytube", "ffmpeg", "wx")
+
+# Run in a fresh interpreter: the same imports as app.py --batch, then the engine is created and closed
+CHILD = """
+import time
+start = time.perf_counter()
+import json
+import sys
+sys.path.insert(0, sys.argv[1])
+import app
+app.parse_args(["--batch", "-"])
+import batch
+imported = time.perf_counter()
+engine = batch.DownloadEngine(None, sys.argv[2])
+created = time.perf_counter()
+engine.close()
+print(json.dumps({"import_ms": (imported - start) * 1000, "engine_ms": (created - imported) * 1000,
+                  "modules": [name for name in sys.argv[3:] if name in sys.modules]}))
+"""
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Startup budget of the batch mode.")
+    parser.add_argument("--runs", type=int, default=5, help="number of fresh interpreters, the best run is kept")
+    parser.add_argument("--import-budget", type=float, default=300, metavar="MS",
+                        help="longest time to import the modules of the batch mode, in ms")
+    parser.add_argument("--engine-budget", type=float, default=100, metavar="MS",
+                        help="longest time to create the engine and load its settings, in ms")
+    return parser.parse_args(argv)
+
+
+def measure(settings_path):
+    """Imports and timings of one fresh interpreter"""
+    result = subprocess.run([sys.executable, "-c", CHILD, SRC_DIR, settings_path, *LAZY_MODULES],
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="ytgui-startup-")
+    settings_path = os.path.join(workdir, "settings.json")
+    try:
+        with open(os.path.join(SRC_DIR, "settings.json"), "r") as src, open(settings_path, "w") as dst:
+            dst.write(src.read())
+        runs = [measure(settings_path) for _ in range(max(1, args.runs))]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {"import_ms": round(min(run["import_ms"] for run in runs), 1),
+               "engine_ms": round(min(run["engine_ms"] for run in runs), 1),
+               "modules": sorted({name for run in runs for name in run["modules"]})}
+    print(json.dumps(results))
+    errors = []
+    if results["import_ms"] > args.import_budget:
+        errors.append(f"imports took {results['import_ms']} ms, over the budget of {args.import_budget:g} ms")
+    if results["engine_ms"] > args.engine_budget:
+        errors.append(f"creating the engine took {results['engine_ms']} ms, over the budget of {args.engine_budget:g} ms")
+    if results["modules"]:
+        errors.append(f"imported at startup: {', '.join(results['modules'])}")
+    for error in errors:
+        print(error, file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Bandwidth limits: token buckets throttling the downloads in the thread reading each chunk, so
+that the connections slow down instead of filling the link. A global bucket is shared by every
+download, and each item has its own bucket for the optional per-item limit. Their rates can be
+changed at any time, the running downloads follow at their next chunk.
+"""
+
+import time
+from threading import Lock
+
+# The bucket holds at most this many seconds of tokens, the largest burst after an idle period
+BURST_TIME = 0.5
+# Longest sleep between two checks of the rate and of the stop request, in seconds
+MAX_SLEEP = 0.1
+
+
+class TokenBucket():
+    """
+    A token bucket whose tokens are bytes, refilled at rate bytes/s (0 for no limit). Chunks are
+    taken whole, possibly putting the bucket in debt: the next chunks then wait until it is paid
+    back, which keeps the average rate right whatever the chunk size.
+    """
+
+    def __init__(self, rate=0):
+        self.lock = Lock()
+        self.rate = max(0, rate)  # Bytes per second, 0 for no limit
+        self.tokens = 0.0  # Available bytes, negative when in debt
+        self.updated = time.perf_counter()  # Last refill
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.refill()
+            self.rate = max(0, rate)
+            if not self.rate:
+                self.tokens = 0.0  # Forget the debt of the previous limit
+
+    def refill(self):
+        """Adds the tokens earned since the last refill. Called with the lock held."""
+        now = time.perf_counter()
+        if self.rate:
+            self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.rate * BURST_TIME)
+        self.updated = now
+
+    def take(self, nbytes):
+        """Takes the tokens of a chunk, without waiting"""
+        with self.lock:
+            if self.rate:
+                self.refill()
+                self.tokens -= nbytes
+
+    def delay(self):
+        """Seconds until the bucket is out of debt, 0 if it is not in debt"""
+        with self.lock:
+            if not self.rate:
+                return 0.0
+            self.refill()
+            return max(0.0, -self.tokens / self.rate)
+
+
+def throttle(buckets, nbytes, cancelled=None):
+    """
+    Takes a chunk of nbytes from every bucket, then blocks until none of them is in debt.
+    Returns early if cancelled() becomes True, so that a stopped download does not wait.
+    """
+    for bucket in buckets:
+        bucket.take(nbytes)
+    while True:
+        delay = max(bucket.delay() for bucket in buckets)
+        if delay <= 0 or (cancelled is not None and cancelled()):
+            return
+        time.sleep(min(delay, MAX_SLEEP))
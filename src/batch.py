@@ -0,0 +1,162 @@
+"""
+Headless batch mode: downloads a list of urls with the download engine, without any user interface.
+
+Progress is printed on stdout as JSON lines (one object per event), so that it can be read by scripts.
+The exit code is 0 if every video was downloaded, 1 if some of them failed, and 2 for usage errors.
+"""
+
+import json
+import os
+import queue
+import sys
+
+from engine import DownloadEngine, parse_urls
+from startup import trace
+
+# Interval between two polls of the engine for updates, in seconds
+POLL_INTERVAL = 0.1
+
+
+def emit(event, **fields):
+    """Prints one event as a JSON line"""
+    fields["event"] = event
+    print(json.dumps(fields), flush=True)
+
+
+def read_urls(path):
+    """Reads the urls listed in a file, or on stdin if path is '-'"""
+    if path == "-":
+        return parse_urls(sys.stdin.read())
+    with open(path, "r") as file:
+        return parse_urls(file.read())
+
+
+class BatchRunner():
+    """
+    Drives a DownloadEngine from the main thread. The engine hooks are queued by the worker threads
+    (in place of wx.CallAfter) and run by the polling loop, along with the progress updates.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.calls = queue.Queue()  # Hooks to run on the main thread
+        engine.call_after = lambda function, *args: self.calls.put((function, args))
+        engine.on_url_loaded = self.on_url_loaded
+        engine.on_url_failed = self.on_url_failed
+        engine.on_videos_found = self.on_videos_found
+
+    def add(self, urls):
+        for vid in self.engine.add_urls(urls):
+            emit("queued", id=vid.id, url=vid.url)
+
+    def on_url_loaded(self, vid):
+        vid.loaded = True
+        emit("loaded", id=vid.id, url=vid.url, title=vid.title, size=vid.get_filesize())
+        self.engine.start_download(vid)
+
+    def on_url_failed(self, vid):
+        emit("failed", id=vid.id, url=vid.url)
+
+    def on_videos_found(self, urls):
+        for vid in self.engine.add_videos(urls):
+            emit("queued", id=vid.id, url=vid.url)
+
+    def flush(self):
+        """Prints the updates published by the worker threads since the last call"""
+        updates, message = self.engine.bus.drain()
+        for vid_id, columns in updates.items():
+            emit("progress", id=vid_id, **columns)
+        if message is not None:
+            emit("message", message=message.strip())
+
+    def run(self):
+        """Runs the hooks and prints the updates until every url has been resolved and downloaded"""
+        while True:
+            try:
+                function, args = self.calls.get(timeout=POLL_INTERVAL)
+                while True:
+                    self.flush()  # Print the pending updates first, so that they don't follow this event
+                    function(*args)
+                    function, args = self.calls.get_nowait()
+            except queue.Empty:
+                pass
+            self.flush()
+            # Idle engine first: its workers post their hooks before they stop counting as busy
+            if not self.engine.busy() and self.calls.empty():
+                break
+        failed = [vid for vid in self.engine.queue if vid.error or not vid.completed]
+        for vid in self.engine.queue:
+            emit("result", id=vid.id, url=vid.url, title=vid.title, ok=vid not in failed,
+                 stages=vid.metrics.as_dict()["stages"])
+        snapshot = self.engine.metrics_snapshot()
+        emit("summary", total=len(self.engine.queue), failed=len(failed), bytes=snapshot["bytes"],
+             failures=snapshot["failures"], retries=snapshot["retries"], stage_seconds=snapshot["stage_seconds"])
+        if self.engine.metrics_file:
+            try:
+                self.engine.export_metrics(self.engine.metrics_file)
+            except OSError as e:
+                emit("message", message=f"Failed to export metrics: {e}")
+        return 1 if failed else 0
+
+
+def run(args):
+    """Entry point of the batch mode, args are the parsed command line arguments (see app.py)"""
+    try:
+        urls = read_urls(args.batch)
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Could not read {args.batch}: {e}", file=sys.stderr)
+        return 2
+    if not urls:
+        print(f"No URL found in {args.batch}", file=sys.stderr)
+        return 2
+    if args.workers is not None and args.workers < 1:
+        print("--workers must be at least 1", file=sys.stderr)
+        return 2
+    if args.limit is not None and args.limit < 0:
+        print("--limit must be positive (0 for no limit)", file=sys.stderr)
+        return 2
+    if args.retries is not None and args.retries < 0:
+        print("--retries must be positive (0 to never retry)", file=sys.stderr)
+        return 2
+
+    engine = DownloadEngine(None)
+    trace.mark("engine created, settings loaded")
+    if args.output is not None:
+        if not os.path.isdir(args.output) and not engine.create_dir:
+            print(f"Invalid save path: {args.output} is not a directory", file=sys.stderr)
+            return 2
+        engine.save_path = args.output
+    if args.audio is not None:
+        engine.only_audio_default = args.audio
+    if args.adaptive is not None:
+        engine.is_progressive_default = not args.adaptive
+    if args.audio_format is not None:
+        engine.audio_format = args.audio_format
+    if args.no_convert:
+        engine.convert_audio = False
+    if args.preset is not None:
+        try:
+            engine.set_quality_preset(args.preset)
+        except ValueError as e:
+            print(f"Invalid quality preset: {e}", file=sys.stderr)
+            return 2
+    if args.workers is not None:
+        engine.max_downloads = args.workers
+        engine.scheduler.set_limit(args.workers)
+    if args.limit is not None:
+        engine.set_bandwidth_limits(total=args.limit)
+    if args.retries is not None:
+        engine.retry_attempts = args.retries
+        engine.retry.attempts = args.retries
+    if args.metrics is not None:
+        engine.metrics_file = args.metrics
+
+    runner = BatchRunner(engine)
+    runner.add(urls)
+    try:
+        return runner.run()
+    except KeyboardInterrupt:
+        emit("message", message="Interrupted")
+        return 1
+    finally:
+        engine.close()
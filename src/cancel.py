@@ -0,0 +1,98 @@
+"""
+Cooperative cancellation of the items. Each item has a token, cancelled from the GUI thread
+without waiting for anything: the workers check it between two blocks of data, and whatever
+can keep them blocked meanwhile (a socket waiting for data, an ffmpeg process) registers an
+abort callback on the token, run as soon as it is cancelled.
+
+A worker thread enters the scope of the token of its item, so that code that does not know
+the item (the HTTP client, the download engine) can find the token with current().
+"""
+
+import itertools
+from contextlib import contextmanager
+from threading import Lock, local
+
+
+class Cancelled(Exception):
+    """Raised in a worker when its item has been cancelled"""
+
+
+class CancelToken():
+    """The cancellation state of an item, and the abort callbacks of its running operations"""
+
+    def __init__(self):
+        self.cancelled = False  # True once cancel() has been called
+        self.callbacks = {}  # Handle -> function run on cancellation
+        self.handles = itertools.count()
+        self.lock = Lock()
+
+    def cancel(self):
+        """
+        Cancels the item and runs the abort callbacks, which never block. Returns False if the
+        token was already cancelled.
+        """
+        with self.lock:
+            if self.cancelled:
+                return False
+            self.cancelled = True
+            callbacks, self.callbacks = list(self.callbacks.values()), {}
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass  # The operation has already ended
+        return True
+
+    def register(self, callback):
+        """Registers a function run on cancellation (at once if already cancelled). Returns a handle for unregister."""
+        with self.lock:
+            if not self.cancelled:
+                handle = next(self.handles)
+                self.callbacks[handle] = callback
+                return handle
+        callback()
+        return None
+
+    def unregister(self, handle):
+        with self.lock:
+            self.callbacks.pop(handle, None)
+
+    @contextmanager
+    def on_cancel(self, callback):
+        """Runs callback if the token is cancelled while the block runs"""
+        handle = self.register(callback)
+        try:
+            yield
+        finally:
+            self.unregister(handle)
+
+    def check(self):
+        """Raises Cancelled if the token has been cancelled"""
+        if self.cancelled:
+            raise Cancelled()
+
+
+_scope = local()
+
+
+@contextmanager
+def scope(token):
+    """Makes token the current token of the thread while the block runs"""
+    previous = getattr(_scope, "token", None)
+    _scope.token = token
+    try:
+        yield token
+    finally:
+        _scope.token = previous
+
+
+def current():
+    """The token of the current thread, None outside of any scope"""
+    return getattr(_scope, "token", None)
+
+
+def check():
+    """Raises Cancelled if the token of the current thread has been cancelled"""
+    token = current()
+    if token is not None:
+        token.check()
@@ -0,0 +1,83 @@
+"""
+Conversion planner: chooses how the downloaded audio of an item becomes the requested file.
+The audio is copied into the target container (a remux, as fast as copying the file) whenever
+its codec allows it, and ffmpeg only re-encodes it when there is no other way.
+"""
+
+# Audio formats the user can choose from. "original" keeps the codec of the stream, in its usual container.
+AUDIO_FORMATS = ("mp3", "m4a", "ogg", "original")
+# Audio codec -> containers it can be copied into without re-encoding (the first one is its usual container)
+COPY_CONTAINERS = {"aac": ("m4a",), "opus": ("ogg", "opus"), "vorbis": ("ogg",), "mp3": ("mp3",)}
+# Encoder used when the audio has to be re-encoded for a format
+ENCODERS = {"mp3": "libmp3lame", "m4a": "aac", "ogg": "libopus"}
+
+
+def audio_codec(stream):
+    """The audio codec of a stream ("aac", "opus", "vorbis", "mp3"), None if it is not known"""
+    for codec in stream.codecs:
+        codec = codec.lower()
+        if codec in ("mp4a.40.34", "mp4a.6b", "mp3"):
+            return "mp3"
+        if codec.startswith("mp4a"):
+            return "aac"
+        if codec in ("opus", "vorbis"):
+            return codec
+    return None
+
+
+class ConversionPlan():
+    """How ffmpeg turns a downloaded stream into the audio file: the output extension, and copy or re-encode"""
+
+    def __init__(self, extension, codec):
+        self.extension = extension  # Extension (and container) of the output file
+        self.codec = codec  # ffmpeg audio codec, "copy" for a remux
+
+    @property
+    def copy(self):
+        return self.codec == "copy"
+
+    @property
+    def status(self):
+        """The status shown while ffmpeg runs"""
+        return f"Remuxing to {self.extension}" if self.copy else f"Converting to {self.extension}"
+
+    def output_path(self, path):
+        """The path of the output file, for the path of the downloaded stream"""
+        return path.rsplit(".", 1)[0] + "." + self.extension
+
+    def options(self, title=""):
+        """Keyword arguments of ffmpeg.output. The title is written to the tags of the file."""
+        options = {"acodec": self.codec}
+        if title:
+            options["metadata"] = f"title={title}"
+        return options
+
+
+def preferred_audio(streams, audio_format):
+    """
+    The index of the first of the streams (sorted best first) that can be turned into the format
+    without re-encoding, 0 if none can.
+    """
+    for index, stream in enumerate(streams):
+        plan = plan_audio(stream, audio_format)
+        if plan is None or plan.copy:
+            return index
+    return 0
+
+
+def plan_audio(stream, audio_format):
+    """
+    Plans the conversion of an audio stream to one of the AUDIO_FORMATS. Returns None if the
+    downloaded file can be kept as it is.
+    """
+    codec = audio_codec(stream)
+    containers = COPY_CONTAINERS.get(codec, ())
+    if audio_format == "original":
+        if not containers:
+            return None  # Unknown codec, the file is not touched
+        if containers[0] == stream.subtype and not stream.includes_video_track:
+            return None
+        return ConversionPlan(containers[0], "copy")
+    if audio_format in containers:
+        return ConversionPlan(audio_format, "copy")
+    return ConversionPlan(audio_format, ENCODERS[audio_format])
@@ -0,0 +1,139 @@
+"""
+An index of the files already downloaded, so that the same content is not fetched again under
+another name or by another item: (video id, itags, conversion) -> output path, size, modification
+time and SHA-256.
+
+The index is a JSON lines file, one line per recorded file (a later line replaces an earlier one
+with the same key), compacted when it is loaded and when it grows too much. An entry is only trusted while its file is unchanged: same size and modification
+time, or same SHA-256 if the file has been touched since it was recorded.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from threading import Lock
+
+# Size of the blocks read to hash a file
+HASH_BLOCK_SIZE = 1024 * 1024
+# The index is compacted when it has this many more lines than entries
+COMPACT_THRESHOLD = 1000
+
+
+def file_hash(path):
+    """The SHA-256 of a file, as a hex string"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DedupIndex():
+    """The index. Keys are strings built by the engine from the video id, the itags and the conversion."""
+
+    def __init__(self, path):
+        self.path = path  # The index file
+        self.entries = None  # Key -> {"path", "size", "mtime", "sha256", "time"}, loaded on first use
+        self.lines = 0  # Number of lines in the index file
+        self.lock = Lock()  # Entries are looked up and added by worker threads
+
+    def load(self):
+        """Reads the index file, and compacts it if some lines are outdated. Called with the lock held."""
+        self.entries = {}
+        lines = 0
+        try:
+            with open(self.path, "r") as file:
+                for line in file:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry
+                    except (ValueError, KeyError, TypeError):
+                        continue  # A line cut by a crash
+        except OSError:
+            pass
+        self.lines = lines
+        if self.lines > len(self.entries):
+            self.compact()
+
+    def compact(self):
+        """Atomically rewrites the index file with one line per entry. Called with the lock held."""
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as file:
+                for entry in self.entries.values():
+                    file.write(json.dumps(entry) + "\n")
+            os.replace(tmp_path, self.path)
+            self.lines = len(self.entries)
+        except OSError:
+            pass
+
+    def get(self, key):
+        """The entry of a key if its file is still there and unchanged, else None"""
+        with self.lock:
+            if self.entries is None:
+                self.load()
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(entry["path"])
+            if stat.st_size != entry["size"]:
+                return None
+            if stat.st_mtime_ns == entry.get("mtime"):
+                return entry
+            # Touched since it was recorded (or recorded without its modification time): the content decides
+            if file_hash(entry["path"]) != entry["sha256"]:
+                return None
+        except OSError:
+            return None
+        entry = dict(entry, mtime=stat.st_mtime_ns)
+        self.record(entry)  # Not hashed again next time
+        return entry
+
+    def add(self, key, path):
+        """Records a downloaded file (hashed here, the file is still in the page cache). Returns the entry."""
+        stat = os.stat(path)
+        entry = {"key": key, "path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime_ns,
+                 "sha256": file_hash(path), "time": time.time()}
+        self.record(entry)
+        return entry
+
+    def record(self, entry):
+        """Adds or replaces an entry, and appends it to the index file"""
+        with self.lock:
+            if self.entries is None:
+                self.load()
+            self.entries[entry["key"]] = entry
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                if self.lines - len(self.entries) >= COMPACT_THRESHOLD:
+                    self.compact()
+                    return
+                with open(self.path, "a") as file:
+                    file.write(json.dumps(entry) + "\n")
+                self.lines += 1
+            except OSError:
+                pass  # Not recorded, the file will just be downloaded again next time
+
+    def materialize(self, entry, path):
+        """
+        Makes the indexed file available at path: nothing to do if it is the same file, else a hard
+        link, or a copy if the file system does not allow it. Returns True if path was created.
+        Raises FileExistsError if another file is already at path, it is never overwritten.
+        """
+        if os.path.abspath(path) == entry["path"]:
+            return False
+        if os.path.exists(path):
+            if os.path.samefile(path, entry["path"]):
+                return False  # Already linked
+            raise FileExistsError(f"{path} already exists")
+        try:
+            os.link(entry["path"], path)
+        except FileExistsError:
+            raise
+        except OSError:
+            shutil.copyfile(entry["path"], path)
+        return True
@@ -0,0 +1,231 @@
+"""
+A download engine fetching a stream over one or several parallel HTTP connections (Range requests).
+
+Data is written to a `.part` file next to the output file, along with a `.part.json` sidecar
+recording the stream and the byte ranges already written. An interrupted download of the
+same stream resumes from these ranges instead of starting over.
+
+Downloads stop with Cancelled when the cancellation token of the calling thread is cancelled
+(see cancel.py): the segment threads inherit it, and their sockets are shut down at once.
+"""
+
+import http.client
+import json
+import os
+import urllib.request
+from threading import Thread, Lock
+
+from cancel import scope, current as current_token, check as check_cancelled
+
+# Headers sent with every request (the same ones pytube uses)
+HEADERS = {"User-Agent": "Mozilla/5.0", "accept-language": "en-US,en"}
+# Largest range requested at once, bigger requests get throttled by YouTube
+RANGE_SIZE = 9 * 1024 * 1024
+# Size of the blocks read from the socket and written to the file
+BLOCK_SIZE = 64 * 1024
+# Ranges smaller than twice this size are not split between connections
+MIN_SEGMENT_SIZE = 1024 * 1024
+# Number of bytes written between two saves of the sidecar file
+SAVE_INTERVAL = 4 * 1024 * 1024
+
+
+class DownloadAborted(Exception):
+    """Raised in a segment thread when another segment has failed"""
+
+
+def merge_ranges(ranges):
+    """Merge a list of [start, end) byte ranges into a sorted list of disjoint ranges"""
+    merged = []
+    for start, end in sorted(ranges):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(done, filesize):
+    """Returns the [start, end) ranges of a file of filesize bytes not covered by the done ranges"""
+    missing = []
+    position = 0
+    for start, end in merge_ranges(done):
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < filesize:
+        missing.append([position, filesize])
+    return missing
+
+
+class PartialDownload():
+    """The on-disk state of an unfinished download: a .part file and its .part.json sidecar"""
+
+    def __init__(self, file_path, stream):
+        self.file_path = file_path  # Final path of the downloaded file
+        self.part_path = file_path + ".part"  # The file being written
+        self.state_path = file_path + ".part.json"  # The sidecar describing the written ranges
+        self.url = stream.url
+        self.itag = stream.itag
+        self.filesize = stream.filesize
+        self.done = []  # The [start, end) ranges already written to the part file
+
+    def load(self):
+        """Reads the sidecar. Ranges are only kept if they were written for the same stream."""
+        self.done = []
+        try:
+            with open(self.state_path, "r") as file:
+                state = json.load(file)
+            if (state["itag"] == self.itag and state["filesize"] == self.filesize
+                    and os.path.getsize(self.part_path) == self.filesize):
+                self.done = merge_ranges(state["ranges"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return self.done
+
+    def save(self, ranges):
+        """Atomically rewrites the sidecar with the given written ranges"""
+        state = {"url": self.url, "itag": self.itag, "filesize": self.filesize, "ranges": merge_ranges(ranges)}
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(state, file)
+        os.replace(tmp_path, self.state_path)
+
+    def open(self):
+        """Creates the part file with its final size, unless there is something to resume"""
+        if not self.done:
+            with open(self.part_path, "wb") as file:
+                file.truncate(self.filesize)
+
+    def finish(self):
+        """Moves the complete part file to its final path and removes the sidecar"""
+        os.replace(self.part_path, self.file_path)
+        try:
+            os.remove(self.state_path)
+        except OSError:
+            pass
+
+
+class SegmentedDownloader():
+    """
+    Downloads a stream by splitting the bytes still missing into segments fetched in
+    parallel. Every segment is written at its own offset in the part file, and the
+    combined progress is reported with the same (stream, chunk, bytes_remaining)
+    signature as pytube's progress callbacks.
+    """
+
+    def __init__(self, connections=4, timeout=30):
+        self.connections = max(1, int(connections))  # Number of parallel connections per stream
+        self.timeout = timeout  # Socket timeout, in seconds
+
+    def split(self, ranges, connections=None):
+        """Splits the [start, end) ranges to fetch so that they can be spread over the connections"""
+        connections = self.connections if connections is None else connections
+        segments = [list(r) for r in ranges]
+        while len(segments) < connections:
+            largest = max(segments, key=lambda r: r[1] - r[0], default=None)
+            if largest is None or largest[1] - largest[0] < 2 * MIN_SEGMENT_SIZE:
+                break
+            middle = (largest[0] + largest[1]) // 2
+            segments.append([middle, largest[1]])
+            largest[1] = middle
+        return sorted(segments)
+
+    def download(self, stream, file_path, on_progress=None, on_complete=None, connections=None):
+        """Downloads (or resumes) the stream to file_path, blocking until every byte has been written"""
+        partial = PartialDownload(file_path, stream)
+        done = partial.load()
+        partial.open()
+
+        segments = self.split(missing_ranges(done, partial.filesize), connections)
+        state = {"remaining": sum(end - start for start, end in segments), "unsaved": 0, "error": None}
+        lock = Lock()  # Mutex for the counters and positions, only held to update them
+        save_lock = Lock()  # Serializes the rewrites of the sidecar
+        # Start and current write position of each segment
+        positions = [[start, start] for start, end in segments]
+        token = current_token()
+
+        def written():
+            return done + [[start, position] for start, position in positions]
+
+        def report(index, chunk):
+            ranges = None
+            with lock:
+                positions[index][1] += len(chunk)
+                state["remaining"] -= len(chunk)
+                remaining = state["remaining"]
+                state["unsaved"] += len(chunk)
+                if state["unsaved"] >= SAVE_INTERVAL:
+                    state["unsaved"] = 0
+                    ranges = written()
+            # Outside of the lock, the other segments keep writing meanwhile. A snapshot saved after a
+            # newer one only makes a resume fetch a few blocks again.
+            if ranges is not None:
+                with save_lock:
+                    partial.save(ranges)
+            if on_progress:
+                on_progress(stream, chunk, remaining)
+
+        def fetch(index, start, end):
+            try:
+                with scope(token), open(partial.part_path, "r+b") as file:
+                    file.seek(start)
+                    self.fetch_range(stream.url, start, end, file.write, lambda chunk: report(index, chunk), state)
+            except BaseException as e:  # Includes Cancelled, raised in the progress callback to stop a download
+                with lock:
+                    if state["error"] is None:
+                        state["error"] = e
+
+        threads = [Thread(target=fetch, args=(index, start, end), daemon=True) for index, (start, end) in enumerate(segments)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if state["error"] is not None:
+            partial.save(written())
+            raise state["error"]
+        partial.finish()
+        if on_complete:
+            on_complete(stream, file_path)
+        return file_path
+
+    def stream_to(self, stream, write, on_progress=None, on_complete=None):
+        """Fetches the stream in order over a single connection, passing each block to write instead of saving it"""
+        state = {"remaining": stream.filesize, "error": None}
+
+        def report(chunk):
+            state["remaining"] -= len(chunk)
+            if on_progress:
+                on_progress(stream, chunk, state["remaining"])
+
+        self.fetch_range(stream.url, 0, stream.filesize, write, report, state)
+        if on_complete:
+            on_complete(stream, None)
+
+    def fetch_range(self, url, start, end, write, report, state):
+        """Fetches the bytes [start, end) of url in order, passing each block to write then report"""
+        position = start
+        while position < end:
+            stop = min(position + RANGE_SIZE, end)
+            headers = dict(HEADERS, Range=f"bytes={position}-{stop - 1}")
+            request = urllib.request.Request(url, headers=headers)
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                if response.status != 206 and position > 0:
+                    raise ValueError(f"The server ignored the Range request (HTTP {response.status})")
+                while position < stop:
+                    check_cancelled()
+                    if state["error"] is not None:
+                        raise DownloadAborted()
+                    try:
+                        block = response.read(min(BLOCK_SIZE, stop - position))
+                    except (OSError, http.client.HTTPException):
+                        check_cancelled()  # The socket was shut down by the cancellation
+                        raise
+                    if not block:
+                        check_cancelled()
+                        raise ConnectionError(f"Connection closed at byte {position} of {url}")
+                    write(block)
+                    position += len(block)
+                    report(block)
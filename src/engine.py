@@ -0,0 +1,1316 @@
+"""
+The download pipeline of the app (resolve, download, merge, convert), without any user interface.
+Used by the GUI (gui.py) and by the headless batch mode (batch.py).
+"""
+
+import asyncio
+import http.client
+import time
+import json
+import os
+import subprocess
+import traceback
+import urllib.parse
+import uuid
+from collections import deque
+from threading import Thread, Lock
+
+from eventloop import EventLoop
+from cancel import CancelToken, Cancelled, scope
+from retry import RetryPolicy, classify, EXPIRED
+from workers import ResolverPool, DownloadScheduler, TranscodePool
+from downloader import SegmentedDownloader, DownloadAborted
+from transcode import NamedPipe, FFmpegProgress
+from videoqueue import VideoQueue
+from journal import QueueJournal
+from streams import StreamIndex, QualityPreset
+from conversion import AUDIO_FORMATS, plan_audio, preferred_audio
+from dedup import DedupIndex
+from httppool import client as http_client
+from progress import ProgressBus
+from metrics import ItemMetrics, Metrics, export as write_metrics
+from bandwidth import TokenBucket, throttle
+from manifest import ManifestCache, CachedStream, describe_youtube
+from startup import LazyModule, preload
+
+# pytube and ffmpeg-python are slow to import, they are only imported when first used
+pytube = LazyModule("pytube")
+exceptions = LazyModule("pytube.exceptions")
+extract = LazyModule("pytube.extract")
+ffmpeg = LazyModule("ffmpeg")
+
+def filesize_to_string(size: int):
+    """Convert a filesize in bytes to a human readable string (empty if the size is not known)"""
+    if size is None:
+        return ""
+    if size > 1000000000:
+        return f"{float(size/1000000000):.2f} GB"
+    elif size > 1000000:
+        return f"{float(size/1000000):.2f} MB"
+    else:
+        return f"{float(size/1000):.2f} kB"
+
+# Number of playlist / channel entries added to the queue at once
+COLLECTION_BATCH_SIZE = 25
+# Number of lines of ffmpeg's error output kept to report failures
+FFMPEG_ERROR_LINES = 20
+
+def parse_urls(text: str):
+    """Split a block of text (multi-line paste, url file) into a list of urls, skipping blank and comment lines"""
+    urls = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        urls.extend(line.split())
+    return urls
+
+class NoMatchingStream(Exception):
+    """Raised when a video has no stream of the selected type (progressive, adaptive or audio only)"""
+
+def first_error(errors):
+    """
+    The error that stopped transfers run in parallel: the first one that is not a transfer stopped
+    because a sibling failed (see the "exit" flag of the stream user data)
+    """
+    for error in errors:
+        if not isinstance(error, (Cancelled, DownloadAborted)):
+            return error
+    return errors[0]
+
+def collection_urls(collection):
+    """Yields the video urls of a playlist or channel, one page of results at a time"""
+    generator = getattr(collection, "url_generator", None)
+    if generator is not None:
+        yield from generator()
+        return
+    for page in collection._paginate():  # pytube < 11 only reads the pages through video_urls, all at once
+        for video in page:
+            yield collection._video_url(video)
+
+def collection_type(url: str):
+    """Returns "playlist" or "channel" if the url points to a list of videos, else None"""
+    parsed = urllib.parse.urlparse(url)
+    query = urllib.parse.parse_qs(parsed.query)
+    if parsed.path.startswith(("/channel/", "/c/", "/user/", "/@")):
+        return "channel"
+    if "list" in query and (parsed.path == "/playlist" or "v" not in query):
+        return "playlist"
+    return None
+
+class VideoData():
+    """An object storing the state of a loaded video url (available streams and selected parameters)"""
+    
+    def __init__(self, is_progressive, only_audio, url=""):
+        # GUI parameters
+        self.id = id(self)  # Unique ID
+        self.key = uuid.uuid4().hex  # Persistent ID, identifies the item in the queue journal
+        self.url = url  # The url this item was loaded from
+        self.loaded = False  # True if the url was succesfully loaded
+        self.error = False  # True if the url failed to load, or the download failed
+        self.downloading = False  # True if the video is currently downloading
+        self.completed = False  # True if the download has completed
+        
+        # Download job parameters
+        self.cancel = CancelToken()  # Cancelled when the user deletes the item from the queue while it is downloading (see cancel.py)
+        self.partial_files = []  # Files written by the current download, removed if it is cancelled
+        self.fetched = {}  # Itag -> path of the streams downloaded by a failed attempt, not fetched again by the retry
+        self.attempts = 0  # Failed attempts of the current download, retried with a backoff delay (see retry.py)
+        self.stale = False  # True if the stream urls have expired, the video is resolved again before the next attempt
+        
+        # User interaction
+        self.custom_filename = ""  # Optional user defined filename
+        self.is_progressive = is_progressive  # True if the selected stream is progressive
+        self.only_audio = only_audio  # True if the user has chosen to download only audio
+        self.selected_astream = 0  # Index of the selected audio stream
+        self.selected_vstream = 0  # Index of the selected video stream
+        self.restored_itags = None  # (video itag, audio itag) restored from the queue journal, selected once the streams are loaded
+
+        # Data
+        self.youtube = None  # The youtube object, None if the streams come from the manifest cache
+        self.video_id = ""  # The youtube video id, once loaded
+        self.title = ""  # The video title
+        self.length = 0  # The video duration, in seconds
+        self.streams = []  # The list of available streams
+        self.index = StreamIndex([])  # The available streams, indexed and sorted once (see streams.py)
+        self.astreams = []  # The filtered audio streams
+        self.vstreams = []  # The filtered video streams
+        self.metrics = ItemMetrics()  # Timestamps and byte counts of the pipeline stages (see metrics.py)
+        self.bandwidth = TokenBucket()  # Per-item bandwidth limit of the download (see bandwidth.py)
+        self.target = None  # (dedup key, output path) of the current download (see dedup.py)
+
+    def set_data(self, youtube):
+        """Use the streams of a resolved youtube object"""
+        self.youtube = youtube  # The youutbe object
+        self.video_id = youtube.video_id
+        self.title = youtube.title
+        self.length = youtube.length
+        self.streams = list(self.youtube.streams)
+        self.index = StreamIndex(self.streams)
+        self.filter_streams()
+        self.restore_selection()
+
+    def set_cached_data(self, manifest):
+        """Use the streams of a cached manifest (see manifest.py)"""
+        self.youtube = None
+        self.video_id = manifest["video_id"]
+        self.title = manifest["title"]
+        self.length = manifest["length"]
+        self.streams = [CachedStream(data, self.title) for data in manifest["streams"]]
+        self.index = StreamIndex(self.streams)
+        self.filter_streams()
+        self.restore_selection()
+
+    def filter_streams(self):
+        """Select the video and audio streams the user can choose from (sorted lists of the index)"""
+        aitag = self.astreams[self.selected_astream].itag if self.selected_astream < len(self.astreams) else None
+        self.vstreams = self.index.video[self.is_progressive]
+        self.astreams = self.index.audio[self.only_audio]
+        # The audio only list also has the webm streams: keep the selected stream if it is in both lists
+        itags = [s.itag for s in self.astreams]
+        self.selected_astream = itags.index(aitag) if aitag in itags else 0
+
+    def refresh_data(self, youtube):
+        """Replace the streams with those of a freshly resolved youtube object, keeping the selected streams"""
+        itags = self.selected_itags()
+        self.set_data(youtube)
+        self.select_itags(*itags)
+
+    def selected_itags(self):
+        """The itags of the selected (video, audio) streams, None if there is no stream"""
+        vitag = self.vstreams[self.selected_vstream].itag if self.vstreams else None
+        aitag = self.astreams[self.selected_astream].itag if self.astreams else None
+        return vitag, aitag
+
+    def select_itags(self, vitag, aitag):
+        """Select the streams with the given itags, or the first ones if they are not available"""
+        itags = [s.itag for s in self.vstreams]
+        self.selected_vstream = itags.index(vitag) if vitag in itags else 0
+        itags = [s.itag for s in self.astreams]
+        self.selected_astream = itags.index(aitag) if aitag in itags else 0
+
+    def restore_selection(self):
+        """Select the streams restored from the queue journal once the streams are known"""
+        if self.restored_itags is not None:
+            self.select_itags(*self.restored_itags)
+            self.restored_itags = None
+
+    def record(self):
+        """The state of the item saved in the queue journal (see journal.py)"""
+        itags = self.selected_itags() if self.streams else self.restored_itags
+        return {"key": self.key, "url": self.url, "video_id": self.video_id, "title": self.title,
+                "custom_filename": self.custom_filename, "only_audio": self.only_audio,
+                "is_progressive": self.is_progressive, "itags": itags,
+                "completed": self.completed and not self.error}
+
+    @staticmethod
+    def from_record(record):
+        """Rebuilds an item saved in the queue journal. Its streams still have to be loaded."""
+        video_data = VideoData(record["is_progressive"], record["only_audio"], record["url"])
+        video_data.key = record["key"]
+        video_data.video_id = record.get("video_id", "")
+        video_data.title = record.get("title", "")
+        video_data.custom_filename = record.get("custom_filename", "")
+        if record.get("itags"):
+            video_data.restored_itags = tuple(record["itags"])
+        return video_data
+
+    def needs_refresh(self):
+        """True if the streams come from the cache and the url of a selected stream has expired"""
+        if self.youtube is not None:
+            return False
+        selected = [self.astreams[self.selected_astream]] if self.astreams else []
+        if not self.only_audio and self.vstreams:
+            selected.append(self.vstreams[self.selected_vstream])
+        return any(stream.expired() for stream in selected)
+
+    def update_stream_type(self, is_progressive):
+        """Re-filter the list of streams when the user changes the type of stream (progressive/adaptive)"""
+        if self.is_progressive != is_progressive:
+            self.selected_vstream = 0
+        self.is_progressive = is_progressive
+        self.filter_streams()
+
+    def selected_streams(self):
+        """The streams downloaded with the current selection (video and / or audio), None if one of them is missing"""
+        try:
+            if self.only_audio:
+                return [self.astreams[self.selected_astream]]
+            elif self.is_progressive:
+                return [self.vstreams[self.selected_vstream]]
+            else:
+                return [self.vstreams[self.selected_vstream], self.astreams[self.selected_astream]]
+        except IndexError:
+            return None
+
+    def get_filesize(self):
+        """Compute the size of the file for the selected stream, in bytes (None if there is no matching stream)"""
+        streams = self.selected_streams()
+        if streams is None:
+            return None
+        return sum(stream.filesize for stream in streams)
+
+    @property
+    def exit(self):
+        """True if the user has requested to delete the item from the queue while it was downloading"""
+        return self.cancel.cancelled
+
+    def request_exit(self):
+        """
+        Stop the download of this video without waiting: its sockets and ffmpeg process are aborted at
+        once, and the job removes its partial files in the background.
+        """
+        self.cancel.cancel()
+
+class DownloadEngine():
+    """
+    Resolves urls and downloads, merges and converts the queued videos. The items are scheduled
+    on an event loop running in one background thread (see eventloop.py), blocking work runs in
+    its pool of threads. The engine never touches a user interface: workers publish their progress
+    to self.bus, and the front-end events are dispatched to the hooks below with call_after, which
+    runs a function on the front-end thread (wx.CallAfter for the GUI).
+    """
+
+    def __init__(self, call_after, settings_path=None, load=True):
+        ## Initialize the app settings
+        # Directory of the current file
+        self.basepath = os.path.dirname(__file__)
+        # Absolute path to the settings file
+        self.settings_path = settings_path or os.path.abspath(os.path.join(self.basepath, "settings.json"))
+        # Content of the settings file, kept in memory so that updates don't have to read it again
+        self.settings = {}
+        # The directory to download files to
+        self.save_path = ""
+        # Wether a directory should be created if the save path is not a valid directory
+        self.create_dir = False
+        # Convert file to mp3 when saving as audio only
+        self.convert_audio = True
+        # Format of the converted audio files, one of AUDIO_FORMATS (see conversion.py)
+        self.audio_format = "mp3"
+        # Number of urls resolved in parallel
+        self.resolver_workers = 4
+        # Maximum number of simultaneous downloads
+        self.max_downloads = 3
+        # Download each stream over several parallel connections
+        self.segmented_download = False
+        # Number of connections per stream for segmented downloads
+        self.connections = 4
+        # Keep interrupted downloads in .part files and resume them on the next attempt
+        self.resume_downloads = True
+        # Pipe downloaded streams straight into ffmpeg instead of merging / converting temporary files
+        self.streaming_mux = False
+        # Number of merges / conversions run at the same time (0 for the number of CPUs)
+        self.transcode_workers = 0
+        # Connections kept open to each host by the shared HTTP client (see httppool.py)
+        self.http_connections = 8
+        # Connection and read timeout of the HTTP requests, in seconds
+        self.http_timeout = 30
+        # Number of retries of a failed download, delay before the first one and longest delay, in seconds
+        self.retry_attempts = 4
+        self.retry_delay = 2
+        self.retry_max_delay = 60
+        # Reuse the files already downloaded (same video, streams and conversion) instead of downloading them again
+        self.deduplicate = True
+        # Age after which a cached manifest is resolved again, in hours
+        self.manifest_cache_ttl = 168
+        # Maximum number of cached manifests
+        self.manifest_cache_size = 1000
+        # Quality preset applied to the new items ("" for none), see QualityPreset in streams.py
+        self.quality_preset = ""
+        self.preset = None
+        # File the metrics are written to after each item ("" for none): a Prometheus textfile if it ends with .prom, else JSON lines
+        self.metrics_file = ""
+        # Bandwidth limit over all downloads, and of each download, in kB/s (0 for no limit)
+        self.bandwidth_limit = 0
+        self.item_bandwidth_limit = 0
+
+        # Default settings of the new items
+        self.only_audio_default = False
+        self.is_progressive_default = True
+
+        ## Front-end hooks, called through call_after (on the front-end thread)
+        self.call_after = call_after
+        # Called with a VideoData once its url has been resolved
+        self.on_url_loaded = None
+        # Called with a VideoData whose url could not be resolved
+        self.on_url_failed = None
+        # Called with a list of video urls found in a playlist or channel
+        self.on_videos_found = None
+
+        ## Initialize the pipeline
+        # Event loop scheduling the items and running ffmpeg, with a pool of threads for the blocking work
+        self.events = EventLoop()
+        # Pool resolving the pending urls
+        self.resolver = ResolverPool(self.events, self.load_url, self.resolver_workers)
+        # Download scheduler, items are started in queue order
+        self.scheduler = DownloadScheduler(self.events, self.run_download, key=lambda vid: self.queue.row(vid) or 0,
+                                           limit=self.max_downloads)
+        # Pool merging / converting the downloaded files, so that download slots free up as soon as the transfers end
+        self.transcoder = TranscodePool(self.events, self.run_transcode, self.transcode_workers)
+        # Resumable, multi-connection download engine (used if segmented_download or resume_downloads is enabled)
+        self.downloader = SegmentedDownloader(self.connections, self.http_timeout)
+        # Every request (pytube and the download engine) goes through the shared pool of keep-alive connections
+        self.http = http_client
+        self.http.install()
+        # Updates published by the worker threads, applied by the front-end
+        self.bus = ProgressBus()
+        # Stage timings and counters of the pipeline
+        self.metrics = Metrics()
+        # Bandwidth limit shared by every download
+        self.bandwidth = TokenBucket()
+        # Retries of the failed downloads
+        self.retry = RetryPolicy(self.retry_attempts, self.retry_delay, self.retry_max_delay)
+        # Resolved manifests of the videos loaded recently
+        self.manifests = ManifestCache(os.path.join(self.basepath, "cache", "manifests"),
+                                       self.manifest_cache_ttl * 3600, self.manifest_cache_size)
+        # Files already downloaded, by video id, itags and conversion
+        self.dedup_index = DedupIndex(os.path.join(self.basepath, "cache", "dedup.jsonl"))
+        # Number of playlists / channels being expanded
+        self.expanding = 0
+        # Number of failed downloads waiting for their next attempt
+        self.retrying = 0
+        # True once close() has been called
+        self.closing = False
+        # Mutex for the expanding and retrying counters
+        self.lock = Lock()
+
+        # VideoData item queue (only modified by the front-end thread)
+        self.queue = VideoQueue()
+        # Journal of the queue, restored on launch (only used by the GUI, see restore_queue)
+        self.journal = None
+
+        # The GUI loads the settings once its window is shown (load=False), to start faster
+        if load:
+            self.load_settings()
+
+    def load_settings(self):
+        """Loads the settings file."""
+        with open(self.settings_path, "r") as file:
+            settings = json.load(file)
+            self.settings = settings
+            self.save_path = settings["save_path"]
+            self.create_dir = settings["create_dir"]
+            self.convert_audio = settings["convert_audio"]
+            self.audio_format = settings.get("audio_format", self.audio_format)
+            if self.audio_format not in AUDIO_FORMATS:
+                self.audio_format = "mp3"
+            self.only_audio_default = settings["only_audio"]
+            self.is_progressive_default = settings["progressive_stream"]
+            self.resolver_workers = settings.get("resolver_workers", self.resolver_workers)
+            self.max_downloads = settings.get("max_downloads", self.max_downloads)
+            self.segmented_download = settings.get("segmented_download", self.segmented_download)
+            self.connections = settings.get("connections", self.connections)
+            self.resume_downloads = settings.get("resume_downloads", self.resume_downloads)
+            self.retry_attempts = settings.get("retry_attempts", self.retry_attempts)
+            self.retry_delay = settings.get("retry_delay", self.retry_delay)
+            self.retry_max_delay = settings.get("retry_max_delay", self.retry_max_delay)
+            self.streaming_mux = settings.get("streaming_mux", self.streaming_mux)
+            self.transcode_workers = settings.get("transcode_workers", self.transcode_workers)
+            self.deduplicate = settings.get("deduplicate", self.deduplicate)
+            self.http_connections = settings.get("http_connections", self.http_connections)
+            self.http_timeout = settings.get("http_timeout", self.http_timeout)
+            self.manifest_cache_ttl = settings.get("manifest_cache_ttl", self.manifest_cache_ttl)
+            self.manifest_cache_size = settings.get("manifest_cache_size", self.manifest_cache_size)
+            self.metrics_file = settings.get("metrics_file", self.metrics_file)
+            self.bandwidth_limit = settings.get("bandwidth_limit", self.bandwidth_limit)
+            self.item_bandwidth_limit = settings.get("item_bandwidth_limit", self.item_bandwidth_limit)
+            try:
+                self.set_quality_preset(settings.get("quality_preset", self.quality_preset))
+            except ValueError:
+                self.set_quality_preset("")
+        self.resolver.set_workers(self.resolver_workers)
+        self.scheduler.set_limit(self.max_downloads)
+        self.downloader.connections = max(1, int(self.connections))
+        self.transcoder.set_workers(self.transcode_workers)
+        self.downloader.timeout = self.http_timeout
+        self.http.configure(max_per_host=self.http_connections, timeout=self.http_timeout)
+        self.manifests.ttl = self.manifest_cache_ttl * 3600
+        self.manifests.max_entries = max(1, int(self.manifest_cache_size))
+        self.set_bandwidth_limits(self.bandwidth_limit, self.item_bandwidth_limit)
+        self.retry = RetryPolicy(self.retry_attempts, self.retry_delay, self.retry_max_delay)
+
+    def preload(self):
+        """Imports pytube and ffmpeg-python in the background, so that they are ready for the first url"""
+        return preload(pytube, extract, exceptions, ffmpeg)
+
+    def set_quality_preset(self, text):
+        """Sets the quality preset applied to the new items ("" for none). Raises ValueError if it is not valid."""
+        self.preset = QualityPreset.parse(text) if text.strip() else None
+        self.quality_preset = str(self.preset) if self.preset is not None else ""
+
+    def set_bandwidth_limits(self, total=None, per_item=None):
+        """
+        Sets the bandwidth limit over all downloads and / or of each download, in kB/s (0 for no limit).
+        Running downloads follow the new limits at their next chunk.
+        """
+        if total is not None:
+            self.bandwidth_limit = max(0, total)
+            self.bandwidth.set_rate(self.bandwidth_limit * 1000)
+        if per_item is not None:
+            self.item_bandwidth_limit = max(0, per_item)
+            for vid in list(self.queue.items):
+                vid.bandwidth.set_rate(self.item_bandwidth_limit * 1000)
+
+    def apply_preset(self, vids, preset=None):
+        """Selects the streams of many loaded items with a preset (the default one if None), returns the changed items"""
+        preset = preset or self.preset
+        if preset is None:
+            return []
+        changed = [vid for vid in vids if vid.loaded and not vid.downloading and not vid.completed and preset.apply(vid)]
+        self.queue.save(changed)
+        return changed
+
+    def update_settings(self, **values):
+        """Updates settings in the settings file, in a single atomic write"""
+        if not self.settings:
+            with open(self.settings_path, "r") as file:
+                self.settings = json.load(file)
+        self.settings.update(values)
+        tmp_path = self.settings_path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self.settings, file, indent=4)
+        os.replace(tmp_path, self.settings_path)
+
+    def restore_queue(self, path=None):
+        """
+        Attaches a journal to the queue, and restores the items left in it by the previous session
+        (front-end thread). Items whose manifest is cached are loaded at once, the others are handed
+        to the resolver pool. Returns the restored items.
+        """
+        self.journal = QueueJournal(path or os.path.join(self.basepath, "cache", "queue.journal"))
+        batch = []
+        pending = []
+        done = []
+        for record in self.journal.load():
+            if record.get("completed"):
+                done.append(record["key"])
+                continue
+            try:
+                video_data = VideoData.from_record(record)
+            except (KeyError, TypeError):
+                continue
+            manifest = self.manifests.get(video_data.video_id) if video_data.video_id else None
+            if manifest is not None:
+                try:
+                    video_data.set_cached_data(manifest)
+                    video_data.loaded = True
+                except (KeyError, TypeError):
+                    pass  # Unreadable manifest, the url is resolved again
+            if not video_data.loaded:
+                pending.append(video_data)
+            batch.append(video_data)
+        self.journal.remove(done)
+        self.queue.extend(batch)
+        self.queue.journal = self.journal
+        self.resolver.submit_many(pending)
+        return batch
+
+    def add_urls(self, urls):
+        """
+        Adds urls to the queue (front-end thread). Playlists and channels are expanded in the background,
+        their videos are passed to on_videos_found. Returns the VideoData items added for the other urls.
+        """
+        videos = []
+        for url in urls:
+            if collection_type(url) is None:
+                videos.append(url)
+            else:
+                self.events.spawn(self.expand_collection, url)
+        return self.add_videos(videos)
+
+    def add_videos(self, urls):
+        """Adds video urls to the queue as pending items and hands them to the resolver pool (front-end thread)"""
+        batch = []
+        for url in urls:
+            video_data = VideoData(self.is_progressive_default, self.only_audio_default, url)
+            self.queue.append(video_data)
+            batch.append(video_data)
+        self.resolver.submit_many(batch)
+        return batch
+
+    def start_download(self, vid):
+        """Hands a loaded item to the download scheduler. Returns False if it is not ready or already handled."""
+        if vid.downloading or vid.completed or not vid.loaded:
+            return False
+        vid.downloading = True
+        self.scheduler.submit(vid)
+        return True
+
+    def busy(self):
+        """True while urls are being resolved or expanded, or items downloaded, merged, converted or waiting to be retried"""
+        with self.lock:  # A retried item is either counted as retrying or waiting (see resubmit)
+            running, waiting = self.scheduler.counts()
+            retrying = self.retrying
+        return (self.resolver.busy() > 0 or self.expanding > 0 or running + waiting > 0 or self.transcoder.busy() > 0
+                or retrying > 0)
+
+    def close(self):
+        """
+        Stops the engine when the app exits: nothing new is started, the running items are cancelled
+        (their partial files are kept, to resume them at the next launch), then the event loop and its
+        threads are shut down. The engine cannot be used afterwards.
+        """
+        if self.closing:
+            return
+        self.closing = True
+        self.scheduler.pause()
+        self.resolver.clear()
+        self.transcoder.clear()
+        for vid in list(self.queue):
+            vid.request_exit()
+        self.events.close()
+
+    def retry_failed(self, vids):
+        """
+        Downloads failed items again (front-end thread), with a new set of attempts and freshly resolved
+        streams. Returns the restarted items.
+        """
+        restarted = []
+        for vid in vids:
+            if vid.error and vid.loaded and not vid.downloading and not vid.exit:
+                vid.error = False
+                vid.completed = False
+                vid.attempts = 0
+                vid.stale = True
+                if self.start_download(vid):
+                    restarted.append(vid)
+        return restarted
+
+    def expand_collection(self, url):
+        """
+        Enumerates the videos of a playlist or channel page by page, and queues them by small batches
+        as soon as their urls are known: the first videos can be resolved and downloaded before the
+        whole list has been read.
+        """
+        count = 0
+        batch = []
+        with self.lock:
+            self.expanding += 1
+        try:
+            if collection_type(url) == "channel":
+                channel = getattr(pytube, "Channel", None)  # Missing in older pytube versions
+                if channel is None:
+                    self.post_status(" Channels are not supported by this version of pytube")
+                    return
+                collection = channel(url)
+            else:
+                collection = pytube.Playlist(url)
+            for video_url in collection_urls(collection):
+                batch.append(video_url)
+                count += 1
+                if len(batch) >= COLLECTION_BATCH_SIZE:
+                    self.call_after(self.on_videos_found, batch)
+                    self.post_status(f" Expanding {url}: {count} video(s) found")
+                    batch = []
+            self.post_status(f" Found {count} video(s) in {url}")
+        except exceptions.PytubeError as e:
+            self.post_status(f" Failed to expand {url}: {e}")
+        except (KeyError, OSError) as e:
+            self.post_status(f" Failed to expand {url}: {e}. The provided URL is probably invalid.")
+        except Exception as e:  # Run in the pool of threads, nobody else would see the error
+            self.post_status(f" Failed to expand {url}: {type(e).__name__}: {e}")
+        finally:
+            if batch:
+                self.call_after(self.on_videos_found, batch)
+            with self.lock:
+                self.expanding -= 1
+
+    def load_url(self, video_data):
+        """Loads the URL of a pending queue item (retrieves available streams). Called by the resolver pool."""
+        url = video_data.url
+        error = None
+        try:
+            self.post_status(f" Processing URL: {url}")
+            self.update_row(video_data, "Processing")
+            
+            restored = video_data.restored_itags is not None  # Keep the choices of a restored item
+            with self.metrics.stage(video_data.metrics, "resolve"):
+                manifest = self.manifests.get(extract.video_id(url))
+                if manifest is None:
+                    video_data.set_data(self.resolve(url))
+                else:
+                    video_data.set_cached_data(manifest)
+            if self.preset is not None and not restored:
+                self.preset.apply(video_data)
+            elif video_data.only_audio and self.convert_audio and not restored:
+                video_data.selected_astream = preferred_audio(video_data.astreams, self.audio_format)
+            if video_data.selected_streams() is None:
+                raise NoMatchingStream("no stream of the selected type")
+            self.queue.save([video_data])
+            self.call_after(self.on_url_loaded, video_data)
+
+            pending = self.resolver.busy() - 1
+            if pending > 0:
+                self.post_status(f" Loaded {video_data.title} ({pending} URL(s) left)")
+            else:
+                self.post_status(f" Loaded {video_data.title}")
+        
+        except exceptions.RegexMatchError as e:
+            self.post_status(f"Failed to extract video id : {url}")
+            error = e
+        except (exceptions.VideoUnavailable, exceptions.VideoPrivate) as e:
+            self.post_status("The video is unavailable or private.")
+            error = e
+        except exceptions.HTMLParseError as e:
+            self.post_status("The HTML could not be parsed.")
+            error = e
+        except exceptions.PytubeError as e:
+            self.post_status(f"Failed to load URL: {e}")
+            error = e
+        except KeyError as e:
+            self.post_status(f"Key Error: {e}. The provided URL is probably invalid.")
+            error = e
+        except NoMatchingStream as e:
+            self.post_status(f" No matching stream: {url}")
+            error = e
+        except Exception as e:
+            self.post_status("Unexpected error")
+            error = e
+        finally:
+            if error is not None:
+                self.fail(video_data, error)
+                self.metrics.item_done(video_data.metrics, False)
+                self.call_after(self.on_url_failed, video_data)
+        return True
+
+    def resolve(self, url):
+        """Fetches the streams of a video (network round-trip) and caches its manifest"""
+        youtube = pytube.YouTube(url)
+        youtube.register_on_complete_callback(self.complete_callback)
+        youtube.register_on_progress_callback(self.progress_callback)
+        try:
+            self.manifests.put(describe_youtube(youtube))
+        except OSError:
+            pass  # The cache is an optimization, the video is loaded anyway
+        return youtube
+
+    def ensure_streams(self, vid):
+        """
+        Resolves a video again if its stream urls have expired (stale after a 403, or loaded from the cache),
+        or if it was loaded from the cache and pytube has to download it
+        """
+        if vid.stale or (vid.youtube is None and (vid.needs_refresh() or not (self.segmented_download or self.resume_downloads))):
+            self.update_row(vid, "Refreshing streams")
+            with self.metrics.stage(vid.metrics, "resolve"):
+                vid.refresh_data(self.resolve(vid.url))
+            vid.stale = False
+
+    def run_download(self, vid):
+        """
+        Downloads an item in the current thread (from the pool of the event loop). Called by the download scheduler.
+        The requests of the thread are aborted if the item is cancelled (see cancel.py).
+        """
+        vid.partial_files = []
+        try:
+            with scope(vid.cancel):
+                vid.cancel.check()
+                if self.deduplicate and self.reuse_download(vid):
+                    done = True
+                elif vid.only_audio:
+                    done = self.download_audio(vid)
+                else:
+                    done = self.download_video(vid)
+                if done:
+                    self.finish(vid)
+        except Cancelled:
+            self.discard(vid)
+        except Exception as e:
+            self.fail_unexpected(vid, e)
+            self.finish(vid)
+
+    async def run_transcode(self, job):
+        """Merges or converts the downloaded files of an item, then finishes it. Run on the event loop by the transcode pool."""
+        vid, function, args = job
+        try:
+            if not vid.exit:
+                await function(vid, *args)
+        except asyncio.CancelledError:
+            raise  # The engine is closing (an Exception before Python 3.8)
+        except Exception as e:
+            if not vid.exit:
+                self.fail_unexpected(vid, e)
+        if vid.exit:
+            await self.events.blocking(self.discard, vid)
+            return
+        vid.completed = True
+        vid.downloading = False
+        await self.events.blocking(self.finish, vid)  # Hashes the file for the dedup index
+
+    def download_target(self, vid):
+        """The (dedup key, output path) of the download of an item with the current settings"""
+        filename = vid.custom_filename or None
+        if vid.only_audio:
+            audio = vid.astreams[vid.selected_astream]
+            plan = plan_audio(audio, self.audio_format) if self.convert_audio else None
+            path = audio.get_file_path(filename=filename, output_path=self.save_path)
+            if plan is None:
+                return f"{vid.video_id}/{audio.itag}/original", path
+            return f"{vid.video_id}/{audio.itag}/{plan.extension}:{plan.codec}", plan.output_path(path)
+        video = vid.vstreams[vid.selected_vstream]
+        path = video.get_file_path(filename=filename, output_path=self.save_path)
+        if vid.is_progressive:
+            return f"{vid.video_id}/{video.itag}/progressive", path
+        audio = vid.astreams[vid.selected_astream]
+        return f"{vid.video_id}/{video.itag}+{audio.itag}/merge", path
+
+    def reuse_download(self, vid):
+        """
+        Completes an item from the dedup index, without any request, if the same video, streams and
+        conversion were already downloaded: the file is hard-linked (or copied) to the output path of
+        the item if it is not already there. Returns False if the item has to be downloaded.
+        """
+        try:
+            vid.target = self.download_target(vid)
+        except IndexError:
+            vid.target = None  # No matching stream, download_* fails the item
+            return False
+        key, path = vid.target
+        entry = self.dedup_index.get(key)
+        if entry is None:
+            return False
+        try:
+            self.dedup_index.materialize(entry, path)
+        except OSError as e:
+            self.post_status(f" Could not reuse {entry['path']}: {e}")
+            return False
+        self.post_status(f" Already downloaded: {entry['path']}")
+        self.update_row(vid, "Done", 100)
+        vid.completed = True
+        vid.downloading = False
+        return True
+
+    def discard(self, vid):
+        """Removes the partial files of a cancelled item (worker thread, the front-end does not wait for it)"""
+        vid.downloading = False
+        if self.closing:
+            return  # Kept, the queue is restored at the next launch and the download resumed
+        for path in vid.partial_files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        vid.partial_files = []
+        vid.fetched = {}
+
+    def finish(self, vid):
+        """Records a finished (or failed) item, and its file in the dedup index"""
+        vid.partial_files = []  # Kept: the output, or the .part files of a failed download to resume it
+        vid.fetched = {}
+        if self.deduplicate and vid.target is not None and not vid.error and not vid.exit:
+            key, path = vid.target
+            try:
+                if os.path.isfile(path) and self.dedup_index.get(key) is None:
+                    self.dedup_index.add(key, path)
+            except OSError:
+                pass
+        self.metrics.item_done(vid.metrics, not vid.error)
+        self.queue.save([vid])  # Completed items are not restored
+        if self.metrics_file:
+            try:
+                self.export_metrics(self.metrics_file)
+            except OSError as e:
+                self.post_status(f" Failed to export metrics: {e}")
+
+    def fail(self, vid, error, status="Failed"):
+        """Marks an item as failed, counting the failure by exception type"""
+        vid.error = True
+        self.metrics.failure(error)
+        self.update_row(vid, status)
+
+    def fail_unexpected(self, vid, error):
+        """Marks an item as failed after an error the pipeline does not handle, and prints its traceback"""
+        self.post_status(f" Unexpected error: {type(error).__name__}: {error}")
+        self.fail(vid, error)
+        vid.completed = True
+        vid.downloading = False
+        traceback.print_exc()
+
+    def retry_later(self, vid, error):
+        """
+        Schedules another attempt of a failed download after a backoff delay, if the failure is transient
+        and the item has attempts left. Expired stream urls are resolved again first, and the bytes already
+        written are resumed (see downloader.py). The delay holds neither a download slot nor a thread.
+        Returns False if the item has failed for good.
+        """
+        kind = classify(error)
+        if kind is None or vid.exit or vid.attempts >= self.retry.attempts:
+            return False
+        delay = self.retry.backoff(vid.attempts)
+        vid.attempts += 1
+        vid.stale = vid.stale or kind == EXPIRED
+        self.metrics.retry(error)  # Only counted as a failure if the last attempt fails too
+        with self.lock:
+            self.retrying += 1
+        self.update_row(vid, f"Retrying in {delay:.0f}s ({vid.attempts}/{self.retry.attempts})")
+        self.post_status(f" {vid.title}: {error}. Retrying in {delay:.0f}s")
+        self.events.call(self.events.loop.call_later, delay, self.resubmit, vid)
+        return True
+
+    def resubmit(self, vid):
+        """Hands an item back to the download scheduler once its backoff delay is over (event loop)"""
+        with self.lock:
+            self.retrying -= 1
+            self.scheduler.submit(vid)  # Under the lock, so that busy() sees the item waiting
+
+    def metrics_snapshot(self):
+        """The aggregate counters of the pipeline (see metrics.py), with the current queue figures"""
+        running, waiting = self.scheduler.counts()
+        snapshot = self.metrics.snapshot(queue_depth=waiting, resolving=self.resolver.busy())
+        snapshot["http"] = self.http.stats()
+        return snapshot
+
+    def item_metrics(self, vids=None):
+        """The stage timings of the items (of the whole queue by default), as dicts"""
+        items = []
+        for vid in list(self.queue.items if vids is None else vids):  # Worker threads export while the queue changes
+            status = "failed" if vid.error else "done" if vid.completed else \
+                     "downloading" if vid.downloading else "loaded" if vid.loaded else "pending"
+            item = {"key": vid.key, "url": vid.url, "video_id": vid.video_id, "title": vid.title, "status": status}
+            item.update(vid.metrics.as_dict())
+            items.append(item)
+        return items
+
+    def export_metrics(self, path):
+        """Writes the metrics to a Prometheus textfile (.prom) or a JSON lines file (any other extension)"""
+        write_metrics(path, self.metrics_snapshot(), self.item_metrics())
+
+    def update_row(self, vid, status=None, progress=None):
+        """Publishes a new status and / or progress for an item (any thread), shown at the next refresh"""
+        self.bus.publish(vid.id, status=status, progress=progress)
+
+    def post_status(self, message):
+        """Publishes a status bar message (any thread), shown at the next refresh"""
+        self.bus.post_message(message)
+
+    def progress_callback(self, stream, chunk, bytes_remaining):
+        """Updates the progress bar."""
+        if stream.user_data:
+            stopped = lambda: stream.user_data["exit"] or stream.user_data["cancel"].cancelled
+            if stopped():
+                raise Cancelled()
+            # Wait for the bandwidth limits before reading the next chunk, which slows the connection down
+            throttle([self.bandwidth, stream.user_data["bandwidth"]], len(chunk), stopped)
+            if stopped():
+                raise Cancelled()
+            vidID = stream.user_data["id"]
+            stream.user_data["metrics"].add(stream.user_data["stages"][stream.itag], len(chunk))
+            self.metrics.add_bytes(len(chunk))
+            # Streams downloaded together share their user data, the progress is computed over all of them
+            remaining = stream.user_data["remaining"]
+            remaining[stream.itag] = bytes_remaining
+            progress = int((1 - float(sum(remaining.values()))/stream.user_data["size"])*100)
+            if progress != stream.user_data["progress"]:
+                stream.user_data["progress"] = progress
+                self.bus.publish(vidID, progress=progress)
+
+    def complete_callback(self, stream, filepath):
+        """Updates the progress bar and status after the last file of an item has been downloaded."""
+        if stream.user_data:
+            stream.user_data["remaining"][stream.itag] = 0
+            if not stream.user_data["final"] or sum(stream.user_data["remaining"].values()) > 0:
+                return  # Other streams are still downloading, or the file still has to be processed
+            self.bus.publish(stream.user_data["id"], status="Done", progress=100)
+
+    def probe_duration(self, filepath):
+        """Probe estimated ffmpeg conversion duration"""
+        duration = 0.0
+        try:
+            probe = ffmpeg.probe(filepath)
+            if 'format' in probe:
+                if 'duration' in probe['format']:
+                    duration = float(probe['format']['duration'])
+        except ffmpeg.Error as err:
+            raise(err)
+        return duration
+
+    async def run_ffmpeg(self, command, duration, vid, status=None):
+        """
+        Execute an ffmpeg command, as a subprocess of the event loop. Returns True if it succeeded,
+        False if it failed or if the item was deleted meanwhile (the process is then terminated).
+        If duration is None the progress bar is left alone. If status is given, the
+        processing speed and throughput are appended to it in the Status column.
+        """
+
+        # Startupinfo to hide console on Windows
+        startupinfo = None
+        if os.name == 'nt':
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+
+        # Start subprocess, with machine readable progress reports written to stdout
+        command = command[:1] + ["-progress", "pipe:1", "-nostats"] + command[1:]
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            startupinfo=startupinfo,
+        )
+
+        # Keep the last lines of stderr for the error message, reading it also prevents ffmpeg from blocking on a full pipe
+        errors = deque(maxlen=FFMPEG_ERROR_LINES)
+        async def read_errors():
+            async for line in process.stderr:
+                errors.append(line)
+        error_reader = asyncio.ensure_future(read_errors())
+
+        # The process is terminated as soon as the item is cancelled, which ends its output
+        def terminate():
+            try:
+                process.terminate()
+            except ProcessLookupError:
+                pass  # Already exited
+        with vid.cancel.on_cancel(lambda: self.events.call(terminate)):
+            parser = FFmpegProgress()
+            start_time = time.time()
+            last_time = 0
+            async for line in process.stdout:
+                report = parser.feed(line.decode("utf-8", "replace"))
+                if report is None:
+                    continue
+                out_time = report["out_time"]
+                if duration and out_time - last_time > 1:
+                    self.update_row(vid, progress=min(int((float(out_time)/duration) * 100), 100))
+                    last_time = out_time
+                if status:
+                    throughput = report["total_size"] / max(time.time() - start_time, 0.001)
+                    speed = "" if report["speed"] is None else f"{report['speed']:.1f}x, "
+                    self.update_row(vid, f"{status} ({speed}{filesize_to_string(throughput)}/s)")
+
+            await process.wait()
+            await error_reader
+        if vid.exit:
+            return False
+        if process.returncode != 0 and errors:
+            self.post_status(" ffmpeg: " + errors[-1].decode("utf-8", "replace").strip())
+        return process.returncode == 0
+
+    def ffmpeg_execute(self, command, duration, vid, status=None):
+        """
+        Execute an ffmpeg command from a worker thread (see run_ffmpeg), and wait for it. Returns True
+        if it succeeded. Raises Cancelled if the item was deleted meanwhile.
+        """
+        success = self.events.run(self.run_ffmpeg(command, duration, vid, status))
+        vid.cancel.check()
+        return success
+
+    def ffmpeg_stream(self, command, inputs, outpath, vid, status=None):
+        """
+        Execute an ffmpeg command reading its inputs from named pipes, while the (stream, pipe) inputs are
+        downloaded into them in parallel. Nothing but the ffmpeg output is written to disk.
+        """
+        errors = []
+        vid.partial_files.append(outpath)
+        def feed(stream, pipe):
+            try:
+                pipe.open()
+                with scope(vid.cancel), self.metrics.transfer(stream.user_data["metrics"], stream.user_data["stages"][stream.itag]):
+                    self.downloader.stream_to(stream, pipe.write, self.progress_callback, self.complete_callback)
+            except BaseException as e:
+                errors.append(e)
+                stream.user_data["exit"] = True  # Stop the other inputs
+            finally:
+                pipe.close()
+
+        threads = [Thread(target=feed, args=item, daemon=True) for item in inputs]
+        for thread in threads:
+            thread.start()
+        try:
+            success = self.ffmpeg_execute(command, None, vid, status)
+        finally:
+            # Unblock the inputs if ffmpeg exited without opening them
+            for stream, pipe in inputs:
+                pipe.abort()
+            for thread in threads:
+                thread.join()
+            for stream, pipe in inputs:
+                pipe.remove()
+
+        if errors or not success:
+            try:
+                os.remove(outpath)  # The output is incomplete
+            except OSError:
+                pass
+            if errors:
+                raise first_error(errors)
+            raise OSError(f"ffmpeg failed to write {outpath}")
+        return True
+
+    def fetch_stream(self, stream, filename=None, filename_prefix=""):
+        """
+        Downloads a stream to the save path. Unless both options are disabled, the download engine is used:
+        over several connections if segmented download is enabled, resuming any previous partial download.
+        """
+        file_path = stream.get_file_path(filename=filename, output_path=self.save_path, filename_prefix=filename_prefix)
+        # The files removed if the item is cancelled: pytube writes the file in place, the download engine to .part files
+        files = stream.user_data["files"]
+        fetched = stream.user_data["fetched"]
+        if (fetched.get(stream.itag) == file_path and os.path.isfile(file_path)
+                and os.path.getsize(file_path) == stream.filesize):
+            # Downloaded by the previous attempt, which failed on the other stream of the item
+            stream.user_data["remaining"][stream.itag] = 0
+            files.append(file_path)
+            return file_path
+        with self.metrics.transfer(stream.user_data["metrics"], stream.user_data["stages"][stream.itag]):
+            try:
+                if not (self.segmented_download or self.resume_downloads):
+                    files.append(file_path)
+                    file_path = stream.download(self.save_path, filename=filename, filename_prefix=filename_prefix)
+                else:
+                    files.extend([file_path + ".part", file_path + ".part.json"])
+                    connections = self.connections if self.segmented_download else 1
+                    file_path = self.downloader.download(stream, file_path, self.progress_callback, self.complete_callback, connections)
+            except Exception:
+                stream.user_data["cancel"].check()  # The error comes from the socket shut down by the cancellation
+                raise
+        stream.user_data["cancel"].check()  # pytube may also end the download quietly when its socket is shut down
+        if not stream.user_data["final"]:
+            files.append(file_path)  # Merged or converted, then removed
+            fetched[stream.itag] = file_path
+        return file_path
+
+    def set_user_data(self, vid, streams, final):
+        """
+        Attach the data read by the download callbacks to the streams of an item. The streams share the
+        same dict, so that their progress is combined and a stop request reaches all of them.
+        final: True if the item is done once the streams are downloaded (no merging / conversion)
+        The first stream is the video of the item, unless it is audio only (the audio stream of an
+        adaptive item can be a progressive stream, so the metrics stage is not taken from the stream).
+        """
+        vid.bandwidth.set_rate(self.item_bandwidth_limit * 1000)
+        roles = ["audio"] if vid.only_audio else ["video", "audio"]
+        user_data = {"id": vid.id, "metrics": vid.metrics, "bandwidth": vid.bandwidth, "progress": 0, "exit": False, "final": final,
+                     "cancel": vid.cancel, "files": vid.partial_files, "fetched": vid.fetched,
+                     "stages": {stream.itag: role for stream, role in zip(streams, roles)},
+                     "size": sum(stream.filesize for stream in streams),
+                     "remaining": {stream.itag: stream.filesize for stream in streams}}
+        for stream in streams:
+            stream.user_data = user_data
+        return user_data
+
+    def download_video(self, vid):
+        """
+        Downloads the YouTube video at the requested url. The streams of adaptive videos are downloaded in parallel.
+        Returns False if the files were handed to the transcode pool to be merged, which finishes the item,
+        or if the download is retried later.
+        """
+        error = None
+        try:
+            self.ensure_streams(vid)
+            if vid.selected_streams() is None:
+                raise NoMatchingStream("no stream of the selected type")
+            video = vid.vstreams[vid.selected_vstream]
+            video_prefix = ""
+            if not vid.is_progressive:
+                video_prefix = "video_"
+            if vid.custom_filename == "":
+                filename = None
+            else:
+                filename = vid.custom_filename
+
+            if vid.is_progressive:
+                self.update_row(vid, "Downloading video")
+                self.set_user_data(vid, [video], True)
+                video_path = self.fetch_stream(video, filename, video_prefix)
+            elif self.streaming_mux:
+                self.update_row(vid, "Downloading and merging")
+                audio = vid.astreams[vid.selected_astream]
+                self.set_user_data(vid, [video, audio], False)
+                outpath = video.get_file_path(filename=filename, output_path=self.save_path)
+                video_pipe = NamedPipe("video")
+                audio_pipe = NamedPipe("audio")
+                command = (ffmpeg.output(ffmpeg.input(audio_pipe.path).audio, ffmpeg.input(video_pipe.path).video,
+                                         outpath, vcodec="copy")
+                            .global_args("-hide_banner")
+                            .overwrite_output()
+                            .compile())
+                with self.metrics.stage(vid.metrics, "merge") as record:
+                    self.ffmpeg_stream(command, [(video, video_pipe), (audio, audio_pipe)], outpath, vid, "Downloading and merging")
+                    record["bytes"] += os.path.getsize(outpath)
+                self.update_row(vid, "Done", 100)
+            else:
+                self.update_row(vid, "Downloading video and audio")
+                audio = vid.astreams[vid.selected_astream]
+                user_data = self.set_user_data(vid, [video, audio], False)
+
+                # The audio is downloaded in a second thread while this one downloads the video
+                audio_result = {}
+                errors = []  # Errors of both transfers, in the order they happened
+                def fetch_audio():
+                    try:
+                        with scope(vid.cancel):
+                            audio_result["path"] = self.fetch_stream(audio, filename, "audio_")
+                    except BaseException as e:
+                        errors.append(e)
+                        user_data["exit"] = True  # Stop the video download as well
+                audio_thread = Thread(target=fetch_audio, daemon=True)
+                audio_thread.start()
+                try:
+                    video_path = self.fetch_stream(video, filename, video_prefix)
+                except BaseException as e:
+                    errors.append(e)
+                    user_data["exit"] = True  # Stop the audio download as well
+                audio_thread.join()
+                if errors:
+                    vid.cancel.check()  # Stopped because the item was deleted
+                    raise first_error(errors)
+                audio_path = audio_result["path"]
+
+                # The download slot is freed while the files wait for a transcode worker
+                self.update_row(vid, "Waiting to merge")
+                self.transcoder.submit((vid, self.merge_files, (video_path, audio_path)))
+                return False
+        
+        except exceptions.RegexMatchError as e:
+            self.post_status(f" The Regex pattern did not return any match for the video")
+            error = e
+        except (exceptions.VideoUnavailable, exceptions.VideoPrivate) as e:
+            self.post_status(" The video is unavailable or private.")
+            error = e
+        except exceptions.HTMLParseError as e:
+            self.post_status(" The HTML could not be parsed.")
+            error = e
+        except exceptions.PytubeError as e:
+            self.post_status(f" Download failed: {e}")
+            error = e
+        except KeyError as e:
+            self.post_status(f" Key Error: {e}. The provided url is probably invalid.")
+            error = e
+        except NoMatchingStream as e:
+            self.post_status(f" No matching stream: {vid.url}")
+            error = e
+        except (OSError, ValueError, http.client.HTTPException) as e:
+            self.post_status(f" Download failed: {e}")
+            error = e
+        if error is not None:
+            if self.retry_later(vid, error):
+                return False
+            self.fail(vid, error, "No matching stream" if isinstance(error, NoMatchingStream) else "Failed")
+        vid.completed = True
+        vid.downloading = False
+        return True
+
+    async def merge_files(self, vid, video_path, audio_path):
+        """Merges the downloaded video and audio files of an item (transcode pool, on the event loop)"""
+        try:
+            self.update_row(vid, "Merging audio and video")
+            outpath = os.path.join(self.save_path, video_path.split(os.path.sep)[-1][6:])
+
+            audio = ffmpeg.input(audio_path).audio
+            video = ffmpeg.input(video_path).video
+            command = (ffmpeg.output(audio, video, outpath, vcodec="copy")
+                        .global_args("-hide_banner")
+                        .overwrite_output()
+                        .compile())
+            vid.partial_files.append(outpath)
+            with self.metrics.stage(vid.metrics, "merge") as record:
+                duration = vid.length or await self.events.blocking(self.probe_duration, video_path)
+                if not await self.run_ffmpeg(command, duration, vid, "Merging audio and video"):
+                    if vid.exit:
+                        return  # The item was deleted while ffmpeg was running
+                    raise OSError(f"ffmpeg failed to write {outpath}")
+                record["bytes"] += os.path.getsize(outpath)
+            os.remove(video_path)
+            os.remove(audio_path)
+            self.update_row(vid, "Done")
+        except ffmpeg.Error as e:
+            self.post_status(f" Merge failed: ffprobe could not read {video_path}")
+            self.fail(vid, e)
+        except (OSError, ValueError) as e:
+            self.post_status(f" Merge failed: {e}")
+            self.fail(vid, e)
+
+    async def convert_file(self, vid, audio_path, plan):
+        """Converts (or remuxes) the downloaded audio file of an item as planned (transcode pool, on the event loop)"""
+        try:
+            self.update_row(vid, plan.status)
+            outpath = plan.output_path(audio_path)
+            audio = ffmpeg.input(audio_path).audio
+            command = (ffmpeg.output(audio, outpath, **plan.options(vid.title))
+                        .global_args("-hide_banner")
+                        .overwrite_output()
+                        .compile())
+            vid.partial_files.append(outpath)
+            with self.metrics.stage(vid.metrics, "convert") as record:
+                duration = vid.length or await self.events.blocking(self.probe_duration, audio_path)
+                if not await self.run_ffmpeg(command, duration, vid, plan.status):
+                    if vid.exit:
+                        return  # The item was deleted while ffmpeg was running
+                    raise OSError(f"ffmpeg failed to write {outpath}")
+                record["bytes"] += os.path.getsize(outpath)
+            os.remove(audio_path)
+            self.update_row(vid, "Done")
+        except ffmpeg.Error as e:
+            self.post_status(f" Conversion failed: ffprobe could not read {audio_path}")
+            self.fail(vid, e)
+        except (OSError, ValueError) as e:
+            self.post_status(f" Conversion failed: {e}")
+            self.fail(vid, e)
+
+    def download_audio(self, vid):
+        """
+        Downloads the audio of the requested youtube video and converts it to the audio format using ffmpeg:
+        the audio is copied into the new container when its codec allows it, else re-encoded (see conversion.py).
+        Returns False if the file was handed to the transcode pool to be converted, which finishes the item,
+        or if the download is retried later.
+        """
+        error = None
+        try:
+            self.ensure_streams(vid)
+            if vid.selected_streams() is None:
+                raise NoMatchingStream("no audio stream")
+            self.update_row(vid, "Downloading")
+            audio = vid.astreams[vid.selected_astream]
+            plan = plan_audio(audio, self.audio_format) if self.convert_audio else None
+            self.set_user_data(vid, [audio], plan is None)
+            if vid.custom_filename == "":
+                filename = None
+            else:
+                filename = vid.custom_filename
+            if plan is not None and self.streaming_mux:
+                status = "Downloading and " + plan.status[0].lower() + plan.status[1:]
+                self.update_row(vid, status)
+                outpath = plan.output_path(audio.get_file_path(filename=filename, output_path=self.save_path))
+                audio_pipe = NamedPipe("audio")
+                command = (ffmpeg.output(ffmpeg.input(audio_pipe.path).audio, outpath, **plan.options(vid.title))
+                            .global_args("-hide_banner")
+                            .overwrite_output()
+                            .compile())
+                with self.metrics.stage(vid.metrics, "convert") as record:
+                    self.ffmpeg_stream(command, [(audio, audio_pipe)], outpath, vid, status)
+                    record["bytes"] += os.path.getsize(outpath)
+                self.update_row(vid, "Done", 100)
+                audio_path = None
+            else:
+                audio_path = self.fetch_stream(audio, filename)
+            if plan is not None and audio_path is not None:
+                self.update_row(vid, "Waiting to convert")
+                self.transcoder.submit((vid, self.convert_file, (audio_path, plan)))
+                return False
+        except exceptions.RegexMatchError as e:
+            self.post_status(f" The Regex pattern did not return any match for the video")
+            error = e
+        except (exceptions.VideoUnavailable, exceptions.VideoPrivate) as e:
+            self.post_status(" The video is unavailable or private.")
+            error = e
+        except exceptions.HTMLParseError as e:
+            self.post_status(" The HTML could not be parsed.")
+            error = e
+        except exceptions.PytubeError as e:
+            self.post_status(f" Download failed: {e}")
+            error = e
+        except KeyError as e:
+            self.post_status(f" Key Error: {e}. The provided url is probably invalid.")
+            error = e
+        except NoMatchingStream as e:
+            self.post_status(f" No matching stream: {vid.url}")
+            error = e
+        except (OSError, ValueError, http.client.HTTPException) as e:
+            self.post_status(f" Download failed: {e}")
+            error = e
+        if error is not None:
+            if self.retry_later(vid, error):
+                return False
+            self.fail(vid, error, "No matching stream" if isinstance(error, NoMatchingStream) else "Failed")
+        vid.completed = True
+        vid.downloading = False
+        return True
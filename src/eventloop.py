@@ -0,0 +1,89 @@
+"""
+The event loop of the engine: one background thread running asyncio, which schedules the queued
+items and runs the ffmpeg processes. Waiting items are entries in the schedulers, and a running
+merge or conversion is a coroutine reading the output of its process, neither holds a thread.
+
+pytube and the HTTP transfers are blocking, they are run in a bounded pool of threads, so that
+the number of threads depends on the concurrency limits and not on the length of the queue.
+Any thread can hand work to the loop: call() and submit() never wait for it.
+"""
+
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, current_thread
+
+# Maximum number of threads running blocking work (resolutions, transfers, file hashing...)
+BLOCKING_WORKERS = 64
+
+
+class EventLoop():
+    """The asyncio loop of the engine and its pool of threads for blocking work, started at creation"""
+
+    def __init__(self, blocking_workers=BLOCKING_WORKERS):
+        # The proactor loop is the one able to run subprocesses on Windows (not the default before Python 3.8)
+        self.loop = asyncio.ProactorEventLoop() if os.name == "nt" else asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix="ytgui-worker")
+        self.loop.set_default_executor(self.executor)
+        if os.name != "nt" and sys.version_info < (3, 8):
+            # Child processes are only watched by the loop of the main thread before Python 3.8, unless
+            # a watcher is attached to this loop (from the main thread, which creates the engine)
+            watcher = asyncio.SafeChildWatcher()
+            watcher.attach_loop(self.loop)
+            asyncio.set_child_watcher(watcher)
+        self.thread = Thread(target=self._run, name="ytgui-loop", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def in_loop(self):
+        """True if called from the loop thread"""
+        return current_thread() is self.thread
+
+    def call(self, function, *args):
+        """Schedules a function call on the loop thread (from any thread)"""
+        if self.in_loop():
+            self.loop.call_soon(function, *args)
+        else:
+            self.loop.call_soon_threadsafe(function, *args)
+
+    def submit(self, coroutine):
+        """Runs a coroutine on the loop (from any thread), returns a concurrent.futures.Future of its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine):
+        """Runs a coroutine on the loop and waits for its result. Must not be called from the loop thread."""
+        if self.in_loop():
+            raise RuntimeError("EventLoop.run would block the loop thread")
+        return self.submit(coroutine).result()
+
+    def blocking(self, function, *args):
+        """Awaitable result of a blocking function run in the pool of threads (loop thread)"""
+        return self.loop.run_in_executor(self.executor, function, *args)
+
+    def spawn(self, function, *args):
+        """Runs a blocking function in the pool of threads (from any thread), returns its future"""
+        return self.executor.submit(function, *args)
+
+    def close(self):
+        """
+        Cancels the tasks still running, stops the loop thread and shuts the pool of threads down
+        (blocking work still running ends on its own, it should have been cancelled). The schedulers
+        must not start anything meanwhile. Must not be called from the loop thread.
+        """
+        if self.loop.is_closed():
+            return
+        self.run(self._cancel_tasks())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.executor.shutdown(wait=False)
+        self.loop.close()
+
+    async def _cancel_tasks(self):
+        tasks = [task for task in asyncio.all_tasks(self.loop) if task is not asyncio.current_task(self.loop)]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,733 @@
+"""
+The wxWidgets user interface of the app. The downloads themselves are run by the engine (engine.py).
+"""
+
+import os
+
+import wx
+from wx.dataview import DataViewListCtrl
+from wx.lib.mixins.listctrl import ListCtrlAutoWidthMixin, TextEditMixin
+
+from engine import DownloadEngine, filesize_to_string, parse_urls
+from startup import trace
+
+# Interval between two refreshes of the view with the updates published by the worker threads, in ms
+UI_REFRESH_INTERVAL = 66
+
+class AutoListCtrl(wx.ListCtrl, ListCtrlAutoWidthMixin, TextEditMixin):
+    """A wxWidgets ListCtrl with auto width."""
+    def __init__(self, parent, ID, pos=wx.DefaultPosition,
+                 size=wx.DefaultSize, style=0):
+        wx.ListCtrl.__init__(self, parent, ID, pos, size, style)
+        ListCtrlAutoWidthMixin.__init__(self)
+        TextEditMixin.__init__(self)
+
+class MainPanel(wx.Panel):
+    """The main app window."""
+    def __init__(self, parent):
+        wx.Panel.__init__(self, parent)
+        self.frame = parent  # Application main frame
+
+        ## Initialize the download pipeline (the settings are loaded once the window is shown)
+        self.engine = DownloadEngine(wx.CallAfter, load=False)
+        self.engine.on_url_loaded = self.on_url_loaded
+        self.engine.on_url_failed = self.on_url_failed
+        self.engine.on_videos_found = self.queue_videos
+        self.frame.Bind(wx.EVT_CLOSE, self.on_close)
+
+        # VideoData item queue (owned by the engine)
+        self.queue = self.engine.queue
+        # Currently selected item in the queue
+        self.selected = -1
+
+        ## Initialize the UI
+        self.init_ui()
+
+    def init_ui(self):
+        """Initializes the UI of the app."""
+        self.main_sizer = wx.BoxSizer(wx.VERTICAL)
+        grid = wx.FlexGridSizer(3, 5, 5)
+
+        # URL input
+        url_label = wx.StaticText(self, label="URL :")
+        self.url_input = wx.TextCtrl(self, size=(540,-1), style=wx.TE_PROCESS_ENTER)
+        self.url_input.Bind(wx.EVT_TEXT_ENTER, self.on_url_input)
+        self.url_input.Bind(wx.EVT_TEXT_PASTE, self.on_url_paste_input)
+
+        self.load_btn = wx.Button(self, label="Load")
+        self.load_btn.Bind(wx.EVT_BUTTON, self.on_url_input)
+        
+        # Save directory input
+        save_label = wx.StaticText(self, label="Save to :")
+        self.save_input = wx.TextCtrl(self, style=wx.TE_PROCESS_ENTER)
+        self.save_input.Bind(wx.EVT_TEXT_ENTER, self.on_save_input)
+        
+        self.browse_btn = wx.Button(self, label="Browse")
+        self.browse_btn.Bind(wx.EVT_BUTTON, self.on_browse)
+        
+        # Download queue
+        queue_label = wx.StaticText(self, label="Queue :")
+        self.table = DataViewListCtrl(self, wx.ID_ANY, size=(-1, 100))
+        self.table.AppendToggleColumn("#", width=20)
+        self.table.AppendTextColumn("Title", width=200)
+        self.table.AppendTextColumn("Size")
+        self.table.AppendTextColumn("Status", width=150)
+        self.table.AppendProgressColumn("Progress")
+        self.table.Bind(wx.dataview.EVT_DATAVIEW_SELECTION_CHANGED, self.on_item_select)
+
+        # Queue edit controls
+        qctrls = wx.BoxSizer(wx.VERTICAL)
+        delete = wx.Button(self, label="Delete selected")
+        delete.Bind(wx.EVT_BUTTON, self.on_delete_items)
+        clear = wx.Button(self, label="Clear completed")
+        clear.Bind(wx.EVT_BUTTON, self.on_clear_completed)
+        move_up = wx.Button(self, label="Move up")
+        move_up.Bind(wx.EVT_BUTTON, lambda event: self.on_move_item(-1))
+        move_down = wx.Button(self, label="Move down")
+        move_down.Bind(wx.EVT_BUTTON, lambda event: self.on_move_item(1))
+        self.pause_btn = wx.ToggleButton(self, label="Pause")
+        self.pause_btn.Bind(wx.EVT_TOGGLEBUTTON, self.on_pause)
+        self.download_btn = wx.Button(self, label='Download')
+        self.download_btn.Bind(wx.EVT_BUTTON, self.on_download)
+        empty_cell = (0,0)
+        qctrls.AddMany([(delete, 0, wx.BOTTOM | wx.EXPAND, 5), (clear, 0, wx.BOTTOM | wx.EXPAND, 5),
+                        (move_up, 0, wx.BOTTOM | wx.EXPAND, 5), (move_down, 0, wx.BOTTOM | wx.EXPAND, 5),
+                        (empty_cell, 1, wx.EXPAND), (self.pause_btn, 0, wx.BOTTOM | wx.EXPAND, 5), (self.download_btn, 0, wx.EXPAND)])
+        
+        # Filename edit box
+        self.name_input = wx.TextCtrl(self, style=wx.TE_PROCESS_ENTER)
+        self.name_input.Bind(wx.EVT_TEXT_ENTER, self.on_name_input)
+        self.name_input.Disable()
+        name_label = wx.StaticText(self, label="Title :")
+        
+        # Video resolution input
+        res_label = wx.StaticText(self, label="Resolution :")
+        self.res_input = wx.Choice(self, choices=["Enter a valid URL"])
+        self.res_input.SetSelection(0)
+        self.res_input.Disable()
+        self.res_input.Bind(wx.EVT_CHOICE, self.on_quality_select)
+
+        # Audio bitrate input
+        bitrate_label = wx.StaticText(self, label="Bitrate :")
+        self.bitrate_input = wx.Choice(self, choices=["Enter a valid URL"])
+        self.bitrate_input.SetSelection(0)
+        self.bitrate_input.Disable()
+        self.bitrate_input.Bind(wx.EVT_CHOICE, self.on_quality_select)
+
+        # Stream type input
+        type_label = wx.StaticText(self, label="Stream type :")
+        type_input = wx.BoxSizer(wx.HORIZONTAL)
+        
+        self.progressive = wx.RadioButton(self, label="progressive", style=wx.RB_GROUP)
+        self.adaptive = wx.RadioButton(self, label="adaptive")
+        self.progressive.Bind(wx.EVT_RADIOBUTTON, self.on_type_input)
+        self.adaptive.Bind(wx.EVT_RADIOBUTTON, self.on_type_input)
+        
+        self.audio_input = wx.CheckBox(self, label="only audio")
+        self.audio_input.Bind(wx.EVT_CHECKBOX, self.on_audio_input)
+
+        self.save_defaults = wx.Button(self, label="Make default")
+        self.save_defaults.Bind(wx.EVT_BUTTON, self.on_save_defaults)
+
+        type_input.Add(self.progressive, 0, wx.TOP, 5)
+        type_input.Add(self.adaptive, 0, wx.TOP, 5)
+        type_input.Add(self.audio_input, 0, wx.TOP, 5)
+        
+        # Set up grid
+        grid.AddMany([
+                    (url_label), (self.url_input, 1, wx.EXPAND), (self.load_btn),
+                    (save_label), (self.save_input, 1, wx.EXPAND), (self.browse_btn),
+                    (queue_label, 1, wx.TOP, 15), (self.table, 1, wx.TOP | wx.EXPAND, 15), (qctrls, 0, wx.TOP | wx.EXPAND, 15),
+                    (name_label), (self.name_input, 1, wx.EXPAND), (empty_cell),
+                    (res_label), (self.res_input, 1, wx.EXPAND), (empty_cell),
+                    (bitrate_label), (self.bitrate_input, 1, wx.EXPAND), (empty_cell),
+                    (type_label, 1, wx.TOP, 5), (type_input, 1, wx.EXPAND), (self.save_defaults)])
+        grid.AddGrowableCol(1, 1)
+        grid.AddGrowableRow(2, 1)
+        self.main_sizer.Add(grid, 1, wx.ALL | wx.EXPAND, 10)
+
+        # Status bar
+        self.status_bar = self.frame.CreateStatusBar(style=wx.BORDER_NONE)
+        self.status_bar.SetStatusStyles([wx.SB_FLAT])
+
+        # Menu
+        menu = wx.Menu()
+        menu.Append(wx.ID_ABOUT, "&About"," A simple GUI to quickly download YouTube videos.")
+        menu_open = menu.Append(wx.ID_OPEN, "&Load URLs from file...\tCtrl+O", " Load every url listed in a text file (one per line).")
+        self.create_dir_menu = menu.Append(wx.ID_APPLY, "Create directory", " Create a directory if the specified one doesn't exist.", kind=wx.ITEM_CHECK)
+        self.convert_audio_menu = menu.Append(wx.ID_ANY, "Convert audio", " Convert files to the audio format when saving as audio only.", kind=wx.ITEM_CHECK)
+        format_menu = wx.Menu()
+        self.audio_format_menus = {
+            "mp3": format_menu.AppendRadioItem(wx.ID_ANY, "mp3", " Re-encode the audio to mp3."),
+            "m4a": format_menu.AppendRadioItem(wx.ID_ANY, "m4a", " Copy AAC audio into an m4a file, re-encode other codecs."),
+            "ogg": format_menu.AppendRadioItem(wx.ID_ANY, "ogg", " Copy Opus / Vorbis audio into an ogg file, re-encode other codecs."),
+            "original": format_menu.AppendRadioItem(wx.ID_ANY, "Original codec", " Never re-encode, keep the codec of the stream in its usual container."),
+        }
+        menu.AppendSubMenu(format_menu, "Audio format", " Format of the converted audio files.")
+        self.segmented_menu = menu.Append(wx.ID_ANY, "Segmented download", " Download each file over several parallel connections.", kind=wx.ITEM_CHECK)
+        self.resume_menu = menu.Append(wx.ID_ANY, "Resume downloads", " Keep interrupted downloads and resume them on the next attempt.", kind=wx.ITEM_CHECK)
+        self.dedup_menu = menu.Append(wx.ID_ANY, "Reuse downloaded files", " Link the files already downloaded instead of downloading them again.", kind=wx.ITEM_CHECK)
+        self.streaming_menu = menu.Append(wx.ID_ANY, "Stream into ffmpeg", " Merge / convert while downloading, without temporary files.", kind=wx.ITEM_CHECK)
+        menu_max_downloads = menu.Append(wx.ID_ANY, "Simultaneous downloads...", " Set the maximum number of videos downloaded at the same time.")
+        menu_bandwidth = menu.Append(wx.ID_ANY, "Bandwidth limit...", " Limit the download speed, over all downloads and of each download.")
+        menu_preset = menu.Append(wx.ID_ANY, "Quality preset...", " Set the rule choosing the streams of the new videos.")
+        menu_apply_preset = menu.Append(wx.ID_ANY, "Apply preset to queue", " Choose the streams of every queued video with the quality preset.")
+        menu_retry = menu.Append(wx.ID_ANY, "Retry failed downloads", " Download every failed video of the queue again.")
+        menu_statistics = menu.Append(wx.ID_ANY, "Statistics...", " Show the download counters and the stage timings of the selected video.")
+        menu_export_metrics = menu.Append(wx.ID_ANY, "Export metrics...", " Save the metrics as a Prometheus textfile or JSON lines.")
+        menu.AppendSeparator()
+        menu_exit = menu.Append(wx.ID_EXIT,"&Quit\tCtrl+Q"," Terminate the program")
+        self.Bind(wx.EVT_MENU, self.on_exit, menu_exit)
+        self.Bind(wx.EVT_MENU, self.on_open_url_file, menu_open)
+        self.Bind(wx.EVT_MENU, self.on_create_dir, self.create_dir_menu)
+        self.Bind(wx.EVT_MENU, self.on_convert_audio, self.convert_audio_menu)
+        for audio_format, item in self.audio_format_menus.items():
+            self.Bind(wx.EVT_MENU, lambda event, audio_format=audio_format: self.on_audio_format(audio_format), item)
+        self.Bind(wx.EVT_MENU, self.on_max_downloads, menu_max_downloads)
+        self.Bind(wx.EVT_MENU, self.on_bandwidth_limit, menu_bandwidth)
+        self.Bind(wx.EVT_MENU, self.on_quality_preset, menu_preset)
+        self.Bind(wx.EVT_MENU, self.on_apply_preset, menu_apply_preset)
+        self.Bind(wx.EVT_MENU, self.on_retry_failed, menu_retry)
+        self.Bind(wx.EVT_MENU, self.on_statistics, menu_statistics)
+        self.Bind(wx.EVT_MENU, self.on_export_metrics, menu_export_metrics)
+        self.Bind(wx.EVT_MENU, self.on_segmented_download, self.segmented_menu)
+        self.Bind(wx.EVT_MENU, self.on_resume_downloads, self.resume_menu)
+        self.Bind(wx.EVT_MENU, self.on_streaming_mux, self.streaming_menu)
+        self.Bind(wx.EVT_MENU, self.on_deduplicate, self.dedup_menu)
+
+        menu_bar = wx.MenuBar()
+        menu_bar.Append(menu,"&Menu") # Adding the "filemenu" to the MenuBar
+        self.frame.SetMenuBar(menu_bar)  # Adding the MenuBar to the Frame content.
+
+        self.SetSizerAndFit(self.main_sizer)
+        self.SetMinSize(self.GetSize())
+
+        # Refresh timer, the only place where worker updates touch the widgets
+        self.refresh_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.on_refresh, self.refresh_timer)
+        self.refresh_timer.Start(UI_REFRESH_INTERVAL)
+
+        # Deferred startup work, once the window has been painted
+        self.Bind(wx.EVT_IDLE, self.on_first_idle)
+
+    def on_first_idle(self, event):
+        """Loads the settings and preloads pytube and ffmpeg once the window is shown (first idle event)"""
+        self.Unbind(wx.EVT_IDLE, handler=self.on_first_idle)
+        trace.mark("window shown")
+        self.engine.load_settings()
+        self.apply_settings()
+        trace.mark("settings loaded")
+        self.engine.preload()
+        self.restore_queue()
+        trace.mark("queue restored")
+
+    def restore_queue(self):
+        """Shows the items left in the queue by the previous session"""
+        batch = self.engine.restore_queue()
+        self.append_rows(batch)
+        for video_data in batch:
+            if video_data.loaded:
+                self.on_url_loaded(video_data)
+
+    def apply_settings(self):
+        """Shows the loaded settings in the widgets and menu"""
+        self.save_input.SetValue(self.engine.save_path)
+        if self.engine.only_audio_default:
+            self.progressive.Disable()
+            self.adaptive.Disable()
+            self.adaptive.SetValue(True)
+        self.progressive.SetValue(self.engine.is_progressive_default)
+        self.adaptive.SetValue(not self.engine.is_progressive_default)
+        self.audio_input.SetValue(self.engine.only_audio_default)
+        self.create_dir_menu.Check(self.engine.create_dir)
+        self.convert_audio_menu.Check(self.engine.convert_audio)
+        self.audio_format_menus[self.engine.audio_format].Check(True)
+        self.segmented_menu.Check(self.engine.segmented_download)
+        self.resume_menu.Check(self.engine.resume_downloads)
+        self.streaming_menu.Check(self.engine.streaming_mux)
+        self.dedup_menu.Check(self.engine.deduplicate)
+
+    def on_create_dir(self, event):
+        """Updates the create_dir setting on change"""
+        self.engine.create_dir = not self.engine.create_dir
+        self.engine.update_settings(create_dir=self.engine.create_dir) 
+
+    def on_convert_audio(self, event):
+        """Updates the create_dir setting on change"""
+        self.engine.convert_audio = not self.engine.convert_audio
+        self.engine.update_settings(convert_audio=self.engine.convert_audio)        
+
+    def on_audio_format(self, audio_format):
+        """Updates the audio_format setting on change"""
+        self.engine.audio_format = audio_format
+        self.engine.update_settings(audio_format=audio_format)
+
+    def on_segmented_download(self, event):
+        """Updates the segmented_download setting on change"""
+        self.engine.segmented_download = not self.engine.segmented_download
+        self.engine.update_settings(segmented_download=self.engine.segmented_download)
+
+    def on_resume_downloads(self, event):
+        """Updates the resume_downloads setting on change"""
+        self.engine.resume_downloads = not self.engine.resume_downloads
+        self.engine.update_settings(resume_downloads=self.engine.resume_downloads)
+
+    def on_streaming_mux(self, event):
+        """Updates the streaming_mux setting on change"""
+        self.engine.streaming_mux = not self.engine.streaming_mux
+        self.engine.update_settings(streaming_mux=self.engine.streaming_mux)
+
+    def on_deduplicate(self, event):
+        """Updates the deduplicate setting on change"""
+        self.engine.deduplicate = not self.engine.deduplicate
+        self.engine.update_settings(deduplicate=self.engine.deduplicate)
+
+    def on_max_downloads(self, event):
+        """Updates the maximum number of simultaneous downloads"""
+        value = wx.GetNumberFromUser("Maximum number of videos downloaded at the same time:", "", "Simultaneous downloads",
+                                     self.engine.max_downloads, 1, 32, self)
+        if value > 0:
+            self.engine.max_downloads = value
+            self.engine.scheduler.set_limit(value)
+            self.engine.update_settings(max_downloads=value)
+
+    def on_bandwidth_limit(self, event):
+        """Updates the bandwidth limits, applied to the running downloads at once"""
+        total = wx.GetNumberFromUser("Download speed over all downloads, in kB/s (0 for no limit):", "", "Bandwidth limit",
+                                     self.engine.bandwidth_limit, 0, 10000000, self)
+        if total < 0:
+            return
+        per_item = wx.GetNumberFromUser("Download speed of each video, in kB/s (0 for no limit):", "", "Bandwidth limit",
+                                        self.engine.item_bandwidth_limit, 0, 10000000, self)
+        if per_item < 0:
+            return
+        self.engine.set_bandwidth_limits(total, per_item)
+        self.engine.update_settings(bandwidth_limit=total, item_bandwidth_limit=per_item)
+        limits = [f"{value} kB/s" if value else "no limit" for value in (total, per_item)]
+        self.frame.SetStatusText(f" Bandwidth limit: {limits[0]} in total, {limits[1]} per video")
+
+    def on_quality_preset(self, event):
+        """Updates the quality preset applied to the new videos"""
+        dlg = wx.TextEntryDialog(self, "Streams chosen for the new videos, e.g. \"adaptive <=1080p <=500MB\" (empty for none):",
+                                 "Quality preset", self.engine.quality_preset)
+        if dlg.ShowModal() == wx.ID_OK:
+            try:
+                self.engine.set_quality_preset(dlg.GetValue())
+                self.engine.update_settings(quality_preset=self.engine.quality_preset)
+                self.frame.SetStatusText(f" Quality preset: {self.engine.quality_preset or 'none'}")
+            except ValueError as e:
+                self.frame.SetStatusText(f" Invalid quality preset: {e}")
+        dlg.Destroy()
+
+    def on_apply_preset(self, event):
+        """Chooses the streams of every loaded video that is not downloading yet with the quality preset"""
+        if self.engine.preset is None:
+            self.frame.SetStatusText(" No quality preset, set one with Menu > Quality preset")
+            return
+        changed = self.engine.apply_preset(self.queue)
+        for vid in changed:
+            self.table.SetTextValue(filesize_to_string(vid.get_filesize()), self.queue.row(vid), 2)
+        if self.selected >= 0:
+            self.on_item_select(None)
+        self.frame.SetStatusText(f" Quality preset applied to {len(changed)} video(s)")
+
+    def on_statistics(self, event):
+        """Shows the counters of the pipeline, and the stage timings of the selected video"""
+        snapshot = self.engine.metrics_snapshot()
+        lines = [f"Downloaded: {filesize_to_string(snapshot['bytes'])} ({filesize_to_string(snapshot['bytes_per_second'])}/s)",
+                 f"Active transfers: {snapshot['active_transfers']}",
+                 f"Waiting: {snapshot['queue_depth']} to download, {snapshot['resolving']} to resolve",
+                 f"Finished: {snapshot['items']['done']} done, {snapshot['items']['failed']} failed"]
+        if snapshot["failures"]:
+            lines.append("Failures: " + ", ".join(f"{name} ({count})" for name, count in sorted(snapshot["failures"].items())))
+        if snapshot["retries"]:
+            lines.append("Retried: " + ", ".join(f"{name} ({count})" for name, count in sorted(snapshot["retries"].items())))
+        http = snapshot["http"]
+        lines.append(f"HTTP: {http['requests']} requests, {http['reuse_rate']:.0%} on kept-alive connections, "
+                     f"{http['wait_seconds']:.1f}s waiting for a connection")
+        lines.append("Time per stage: " + ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in snapshot["stage_seconds"].items()))
+        if 0 <= self.selected < len(self.queue):
+            vid = self.queue[self.selected]
+            lines.append("")
+            lines.append(f"{vid.custom_filename or vid.title or vid.url}: {vid.metrics.summary() or 'not started'}")
+        wx.MessageBox("\n".join(lines), "Statistics", wx.OK | wx.ICON_INFORMATION, self)
+
+    def on_export_metrics(self, event):
+        """Saves the metrics to a Prometheus textfile or a JSON lines file"""
+        dlg = wx.FileDialog(self, "Export metrics to:", wildcard="Prometheus textfile (*.prom)|*.prom|JSON lines (*.jsonl)|*.jsonl",
+                            style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT)
+        if dlg.ShowModal() == wx.ID_OK:
+            try:
+                self.engine.export_metrics(dlg.GetPath())
+                self.frame.SetStatusText(f" Metrics exported to {dlg.GetPath()}")
+            except OSError as e:
+                self.frame.SetStatusText(f" Could not export metrics: {e}")
+        dlg.Destroy()
+
+    def on_pause(self, event):
+        """Pauses / resumes the download queue (running downloads are not interrupted)"""
+        if self.pause_btn.GetValue():
+            self.engine.scheduler.pause()
+            self.pause_btn.SetLabel("Resume")
+            running, waiting = self.engine.scheduler.counts()
+            self.frame.SetStatusText(f" Queue paused ({running} running, {waiting} waiting)")
+        else:
+            self.engine.scheduler.resume()
+            self.pause_btn.SetLabel("Pause")
+            self.frame.SetStatusText(" Queue resumed")
+
+    def on_save_input(self, event):
+        """Updates the save_dir setting on input"""
+        del event
+        value = self.save_input.GetValue()
+        if os.path.isdir(value):
+            self.engine.save_path = value
+            self.engine.update_settings(save_path=value)
+            self.SetStatusText(f" Save path set to {self.engine.save_path}")
+            self.download_btn.SetFocus()
+        elif self.engine.create_dir:
+            self.engine.save_path = value
+            self.SetStatusText(f" A new directory will be created: {value}.")
+        else:
+            self.SetStatusText(f" Unkown directory: {value}")
+    
+    def on_save_defaults(self, event):
+        prog = self.progressive.GetValue()
+        audio = self.audio_input.GetValue()
+
+        self.engine.update_settings(progressive_stream=prog, only_audio=audio)
+        self.engine.only_audio_default = audio
+        self.engine.is_progressive_default = prog
+        self.table.SetFocus()
+
+    def on_url_input(self, event):
+        """Loads the available streams on url input"""
+        urls = parse_urls(self.url_input.GetValue())
+        if urls:
+            self.queue_urls(urls)
+        else:
+            self.frame.SetStatusText(" You didn't enter anything !")
+            self.url_input.SetFocus()
+        event.Skip()
+    
+    def on_url_paste_input(self, event):
+        """Directely loads the available streams on url paste (every line of a multi-line paste is loaded)"""
+        text_data = wx.TextDataObject()
+        success = False
+        if wx.TheClipboard.Open():
+            success = wx.TheClipboard.GetData(text_data)
+            wx.TheClipboard.Close()
+        if success:
+            urls = parse_urls(text_data.GetText())
+            if urls:
+                self.queue_urls(urls)
+            else:
+                self.frame.SetStatusText(" You didn't enter anything !")
+                self.url_input.SetFocus()
+        event.Skip()
+
+    def on_open_url_file(self, event):
+        """Loads every url listed in a text file"""
+        dlg = wx.FileDialog(self, "Choose a file of URLs:", wildcard="Text files (*.txt)|*.txt|All files (*.*)|*.*",
+                            style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST)
+        if dlg.ShowModal() == wx.ID_OK:
+            try:
+                with open(dlg.GetPath(), "r") as file:
+                    urls = parse_urls(file.read())
+                if urls:
+                    self.queue_urls(urls)
+                else:
+                    self.frame.SetStatusText(f" No URL found in {dlg.GetPath()}")
+            except (OSError, UnicodeDecodeError) as e:
+                self.frame.SetStatusText(f" Could not read {dlg.GetPath()}: {e}")
+        dlg.Destroy()
+
+    def queue_urls(self, urls):
+        """Adds a batch of urls to the queue. Playlists and channels are expanded in the background."""
+        self.append_rows(self.engine.add_urls(urls))
+
+    def queue_videos(self, urls):
+        """Adds a batch of video urls found in a playlist or channel to the queue"""
+        self.append_rows(self.engine.add_videos(urls))
+
+    def append_rows(self, batch):
+        """Shows the new pending items in the queue view"""
+        if not batch:
+            return
+        for video_data in batch:
+            self.table.AppendItem([False, video_data.url, "-", "Pending", 0])
+        self.frame.SetStatusText(f" Loading {self.engine.resolver.busy()} URL(s)")
+
+    def on_type_input(self, event):
+        """Re-filter the currently loaded streams to match the requested stream type"""
+        progressive = self.progressive.GetValue()
+        if len(self.queue) > 0 and self.selected >= 0: # only apply a filter if a URL has been loaded
+            vid = self.queue[self.selected]
+            vid.update_stream_type(progressive)
+            
+            self.res_input.Clear()
+            self.res_input.AppendItems([e.resolution for e in vid.vstreams])
+            self.res_input.Select(vid.selected_vstream)
+            
+            if progressive:
+                self.bitrate_input.Disable()
+            else:
+                self.bitrate_input.Enable()
+            self.table.SetTextValue(filesize_to_string(vid.get_filesize()), self.selected, 2)
+            self.queue.save([vid])
+            
+    def on_audio_input(self, event):
+        """Re-filter currently loaded stream and update settings"""
+        only_audio = self.audio_input.GetValue()
+
+        if only_audio:
+            self.progressive.Disable()
+            self.adaptive.Disable()
+            self.res_input.Disable()
+            if self.progressive.GetValue():
+                self.adaptive.SetValue(True)
+                self.on_type_input(None)
+        else:
+            self.progressive.Enable()
+            self.adaptive.Enable()
+
+        if len(self.queue) > 0 and self.selected >= 0:
+            vid = self.queue[self.selected]
+            vid.only_audio = only_audio
+            if only_audio:
+                vid.is_progressive = False
+            else:
+                self.res_input.Enable()
+            if vid.loaded:
+                vid.filter_streams()  # The webm audio streams are only listed for audio downloads
+                self.bitrate_input.Clear()
+                self.bitrate_input.AppendItems([str(e.abr) + " - " + str(e.subtype) for e in vid.astreams])
+                self.bitrate_input.Select(vid.selected_astream)
+            self.table.SetTextValue(filesize_to_string(vid.get_filesize()), self.selected, 2)
+            self.queue.save([vid])
+    
+    def on_quality_select(self, event):
+        """Record the selected video / audio quality"""
+        if len(self.queue) > 0 and self.selected >= 0:
+            vid = self.queue[self.selected]
+            vid.selected_vstream = self.res_input.GetSelection()
+            vid.selected_astream = self.bitrate_input.GetSelection()
+            self.table.SetTextValue(filesize_to_string(vid.get_filesize()), self.selected, 2)
+            self.queue.save([vid])
+
+    def on_item_select(self, event):
+        """Update stream parameters to match selected item"""
+        self.selected = self.table.GetSelectedRow()
+
+        if self.selected >= 0 and self.queue[self.selected].loaded:
+            self.name_input.Enable()
+            self.name_input.SetValue(self.table.GetValue(self.selected, 1))
+            vid = self.queue[self.selected]
+
+            self.res_input.Clear()
+            self.res_input.AppendItems([str(e.resolution) for e in vid.vstreams])
+            self.res_input.Select(vid.selected_vstream)
+
+            self.bitrate_input.Clear()
+            self.bitrate_input.AppendItems([str(e.abr) + " - " + str(e.subtype) for e in vid.astreams])
+            self.bitrate_input.Select(vid.selected_astream)
+
+            self.progressive.SetValue(vid.is_progressive)
+            self.adaptive.SetValue(not vid.is_progressive)
+            self.audio_input.SetValue(vid.only_audio)
+
+            if vid.only_audio:
+                self.res_input.Disable()
+                self.progressive.Disable()
+                self.adaptive.Disable()
+            else:
+                self.res_input.Enable()
+                self.progressive.Enable()
+                self.adaptive.Enable()
+
+            if vid.is_progressive:
+                self.bitrate_input.Disable()
+            else:
+                self.bitrate_input.Enable()
+        else:
+            self.name_input.Clear()
+            self.name_input.Disable()
+            self.bitrate_input.Clear()
+            self.res_input.Clear()
+    
+    def on_move_item(self, offset):
+        """Moves the selected item up or down the queue, which changes the order it will be downloaded in"""
+        index = self.selected
+        target = index + offset
+        if index < 0 or target < 0 or target >= self.table.GetItemCount():
+            return
+        for col in range(self.table.GetColumnCount()):
+            value = self.table.GetValue(index, col)
+            self.table.SetValue(self.table.GetValue(target, col), index, col)
+            self.table.SetValue(value, target, col)
+        self.queue.swap(index, target)
+        self.engine.scheduler.reprioritize([self.queue[index], self.queue[target]])
+        self.selected = target
+        self.table.SelectRow(target)
+        self.table.SetFocus()
+
+    def remove_rows(self, rows):
+        """Removes the items at the given rows from the queue and the view"""
+        if not rows:
+            return
+        self.queue.remove_rows(rows)
+        for row in sorted(rows, reverse=True):
+            self.table.DeleteItem(row)
+        # Keep the selection on the same item, or on the item that took the place of a removed selected item
+        self.selected -= sum(1 for row in rows if row < self.selected)
+        if self.selected >= len(self.queue):
+            self.selected = len(self.queue) - 1
+
+    def on_delete_items(self, event):
+        rows = []
+        for index, vid in enumerate(self.queue):
+            if self.table.GetToggleValue(index, 0) and vid.loaded:
+                if vid.downloading and not self.engine.scheduler.remove(vid):
+                    vid.request_exit()
+                rows.append(index)
+        self.remove_rows(rows)
+        if len(self.queue) == 0:
+            self.name_input.Clear()
+            self.name_input.Disable()
+            self.bitrate_input.Clear()
+            self.res_input.Clear()
+        else:
+            self.table.SelectRow(self.selected)
+            self.on_item_select(None)
+        self.table.SetFocus()
+    
+    def on_clear_completed(self, event):
+        self.remove_rows([index for index, vid in enumerate(self.queue) if vid.completed])
+        if len(self.queue) == 0:
+            self.name_input.Clear()
+            self.name_input.Disable()
+            self.bitrate_input.Clear()
+            self.res_input.Clear()
+        else:
+            self.table.SelectRow(self.selected)
+            self.on_item_select(None)
+        self.table.SetFocus()
+
+    def on_name_input(self, event):
+        name = self.name_input.GetValue()
+        if name:
+            if len(self.queue) > 0 and self.selected >= 0:
+                self.table.SetTextValue(name, self.selected, 1)
+                self.queue[self.selected].custom_filename = name
+                self.queue.save([self.queue[self.selected]])
+                self.table.SetFocus()
+
+    def on_url_loaded(self, video_data):
+        """Shows a resolved item in the queue view (GUI thread)"""
+        self.on_refresh(None)  # Apply the pending updates first, so that they don't overwrite this one
+        row = self.queue.row(video_data)
+        if row is None:
+            return
+        self.table.SetTextValue(video_data.custom_filename or video_data.title, row, 1)
+        self.table.SetTextValue(filesize_to_string(video_data.get_filesize()), row, 2)
+        self.table.SetTextValue("Processed", row, 3)
+        video_data.loaded = True
+        if self.selected < 0 or self.selected == row:
+            self.table.SelectRow(row)
+            self.on_item_select(None)
+
+    def on_url_failed(self, video_data):
+        """Removes an item whose url could not be resolved (GUI thread)"""
+        index = self.queue.row(video_data)
+        if index is None:
+            return
+        was_selected = self.selected == index
+        self.remove_rows([index])
+        if was_selected:
+            self.selected = -1
+            self.on_item_select(None)
+
+    def on_download(self, event):
+        """Adds the loaded videos to the download scheduler"""
+        if (not self.engine.create_dir) and (not os.path.isdir(self.engine.save_path)):
+            self.SetStatusText(f" Invalid save path: {self.engine.save_path} is not a directory")
+        for vid in self.queue:
+            if self.engine.start_download(vid):
+                self.table.SetTextValue("Waiting", self.queue.row(vid), 3)
+        running, waiting = self.engine.scheduler.counts()
+        self.frame.SetStatusText(f" Downloading {running} video(s), {waiting} waiting")
+
+    def on_retry_failed(self, event):
+        """Hands the failed videos back to the download scheduler, with their streams resolved again"""
+        self.on_refresh(None)  # Apply the pending updates first, so that they don't overwrite these ones
+        restarted = self.engine.retry_failed(self.queue)
+        for vid in restarted:
+            row = self.queue.row(vid)
+            self.table.SetTextValue("Waiting", row, 3)
+            self.table.SetValue(0, row, 4)
+        self.frame.SetStatusText(f" Retrying {len(restarted)} failed download(s)")
+
+    def on_browse(self, event):
+        """Browse for a directory."""
+        dlg = wx.DirDialog(self, "Choose a directory:",
+                          style=wx.DD_DEFAULT_STYLE | wx.DD_DIR_MUST_EXIST)
+        if dlg.ShowModal() == wx.ID_OK:
+            self.engine.save_path = dlg.GetPath()
+            self.save_input.SetValue(self.engine.save_path)
+            self.engine.update_settings(save_path=self.engine.save_path)
+            self.SetStatusText(f" Save path set to {self.engine.save_path}")
+        dlg.Destroy()
+
+    def on_exit(self, event):
+        """Closes the window."""
+        self.Close()
+        event.Skip()
+
+    def on_close(self, event):
+        """Stops the engine (and its threads) when the window is closed"""
+        self.refresh_timer.Stop()
+        self.engine.close()
+        event.Skip()
+
+    def on_refresh(self, event):
+        """Applies the updates published by the worker threads since the last refresh, in one batch"""
+        updates, message = self.engine.bus.drain()
+        for vid_id, columns in updates.items():
+            row = self.queue.rows.get(vid_id)
+            if row is None:
+                continue  # The item was removed from the queue
+            if "status" in columns:
+                self.table.SetTextValue(columns["status"], row, 3)
+            if "progress" in columns:
+                self.table.SetValue(columns["progress"], row, 4)
+        if not message is None:
+            self.frame.SetStatusText(message)
+
+class MainFrame(wx.Frame):
+    """Application main frame"""
+
+    def __init__(self):
+        wx.Frame.__init__(self, parent=None, title='ytgui')
+        
+        # Add main panel
+        self.frame_sizer = wx.BoxSizer(wx.VERTICAL)
+        main_panel = MainPanel(self)
+        self.frame_sizer.Add(main_panel, 1, wx.EXPAND)
+        self.SetSizerAndFit(self.frame_sizer)
+        
+        # Load the icon
+        self.SetIcon(wx.Icon(os.path.abspath(os.path.join(os.path.dirname(__file__), "icon.ico"))))
+        # Show the GUI
+        self.Show()
+
+
+def main():
+    app = wx.App()
+    trace.mark("wx.App created")
+    MainFrame()
+    trace.mark("main frame created")
+    app.MainLoop()
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,300 @@
+"""
+A pooled keep-alive HTTP client shared by every request of the app: pytube resolving videos, the
+download engine fetching ranges, and the HEAD requests of cached streams. urllib opens a new
+connection (TCP and TLS handshakes) for every request; installed as urllib's opener, the pool
+keeps the connections of each host open and hands them to the next requests instead.
+
+The number of connections per host is limited, requests wait for a free one, and statistics
+(reuse rate, wait time) are kept to tune the limits for large batches. A request sent in the
+scope of a cancellation token (see cancel.py) is aborted as soon as the token is cancelled.
+"""
+
+import http.client
+import io
+import socket
+import ssl
+import time
+import urllib.error
+import urllib.request
+from threading import Lock, BoundedSemaphore
+
+from cancel import Cancelled, current as current_token
+
+# Error responses up to this size are read at once, so that their connection is freed even if nobody reads them
+ERROR_BODY_SIZE = 64 * 1024
+# Interval between two checks of the cancellation token while waiting for a free connection, in seconds
+CANCEL_POLL_INTERVAL = 0.1
+# Connection errors after which a request on a reused connection is sent again on a new one (the host closed it)
+STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionResetError,
+                ConnectionAbortedError, BrokenPipeError)
+
+
+class PooledResponse():
+    """
+    A response read from a pooled connection, with the interface urllib and pytube use. The
+    connection goes back to the pool once the body has been read entirely, or is closed if the
+    response is closed before that.
+    """
+
+    def __init__(self, client, lease, response, url, method):
+        self.client = client
+        self.lease = None  # (host key, connection, semaphore, cancellation), None once released
+        self.response = response
+        self.url = url
+        self.status = self.code = response.status
+        self.reason = self.msg = response.reason
+        self.headers = response.headers
+        self.body = None  # The body of an error or empty response, read at once
+        if method == "HEAD" or response.length == 0 or \
+                (response.status >= 400 and (response.length or 0) <= ERROR_BODY_SIZE):
+            self.body = io.BytesIO(response.read())
+        self.lease = lease
+        self.check()
+
+    def read(self, amt=None):
+        data = self.body.read(amt) if self.body is not None else self.response.read(amt)
+        self.check()
+        return data
+
+    def readinto(self, buffer):
+        if self.body is not None:
+            return self.body.readinto(buffer)
+        count = self.response.readinto(buffer)
+        self.check()
+        return count
+
+    def readline(self, limit=-1):
+        if self.body is not None:
+            return self.body.readline(limit)
+        line = self.response.readline(limit)
+        self.check()
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+    def check(self):
+        """Returns the connection to the pool once the whole body has been read"""
+        if self.lease is not None and self.response.isclosed():
+            self.client.release(self.lease, reusable=True)
+            self.lease = None
+
+    def close(self):
+        if self.lease is not None:
+            self.client.release(self.lease, reusable=False)  # Unread data is left on the connection
+            self.lease = None
+        self.response.close()
+
+    def __del__(self):
+        if getattr(self, "lease", None) is not None:
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return self.status
+
+    def geturl(self):
+        return self.url
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def getheaders(self):
+        return list(self.headers.items())
+
+    def isclosed(self):
+        return self.lease is None and self.response.isclosed()
+
+
+class PooledHandler(urllib.request.BaseHandler):
+    """The urllib handler sending the http(s) requests through the client"""
+
+    handler_order = 400  # Before urllib's own handlers, which open a new connection for each request
+
+    def __init__(self, client):
+        self.client = client
+
+    def http_open(self, request):
+        if getattr(request, "_tunnel_host", None):
+            return None  # HTTPS through a proxy, left to urllib
+        return self.client.open(request)
+
+    https_open = http_open
+
+
+class HttpClient():
+    """The connection pool: idle keep-alive connections and a connection limit for each host."""
+
+    def __init__(self, max_per_host=8, timeout=30, idle_timeout=60):
+        self.max_per_host = max(1, int(max_per_host))  # Connections open at the same time to one host
+        self.timeout = timeout  # Connection and read timeout, in seconds (unless urlopen is given one)
+        self.idle_timeout = idle_timeout  # Idle connections older than this are closed instead of reused, in seconds
+        self.idle = {}  # Host key -> [(connection, time it became idle)]
+        self.limits = {}  # Host key -> semaphore of its connections
+        self.handlers = []  # Extra urllib handlers of the installed opener
+        self.lock = Lock()
+        self.stats_data = {"requests": 0, "reused": 0, "opened": 0, "retried": 0, "errors": 0,
+                           "waits": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+    def configure(self, max_per_host=None, timeout=None, idle_timeout=None):
+        """Changes the limits. Connections in use keep counting against the limit they were taken under."""
+        with self.lock:
+            if max_per_host is not None and max(1, int(max_per_host)) != self.max_per_host:
+                self.max_per_host = max(1, int(max_per_host))
+                self.limits = {}  # Leases keep the semaphore they were taken from
+            if timeout is not None:
+                self.timeout = timeout
+            if idle_timeout is not None:
+                self.idle_timeout = idle_timeout
+
+    def install(self, *handlers):
+        """
+        Makes urllib.request.urlopen (used by pytube and the download engine) send its requests
+        through the pool. Extra handlers are added to the opener, and kept by later installs.
+        """
+        self.handlers.extend(handlers)
+        urllib.request.install_opener(urllib.request.build_opener(PooledHandler(self), *self.handlers))
+
+    def uninstall(self):
+        """Restores urllib's default opener, and closes the idle connections"""
+        self.handlers = []
+        urllib.request.install_opener(None)
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection.close()
+
+    def acquire(self, key, timeout, token=None):
+        """
+        Takes a connection to a host, waiting for one if the host is at its limit. Returns a lease.
+        If a cancellation token is given, the socket is shut down when it is cancelled, and the wait
+        for a connection raises Cancelled.
+        """
+        with self.lock:
+            semaphore = self.limits.setdefault(key, BoundedSemaphore(self.max_per_host))
+        waited = 0.0
+        if not semaphore.acquire(blocking=False):
+            start = time.perf_counter()
+            while not semaphore.acquire(timeout=CANCEL_POLL_INTERVAL):
+                if token is not None and token.cancelled:
+                    raise Cancelled()
+            waited = time.perf_counter() - start
+        connection = None
+        with self.lock:
+            self.stats_data["requests"] += 1
+            if waited:
+                self.stats_data["waits"] += 1
+                self.stats_data["wait_seconds"] += waited
+                self.stats_data["max_wait_seconds"] = max(self.stats_data["max_wait_seconds"], waited)
+            idle = self.idle.get(key, [])
+            now = time.monotonic()
+            while idle:
+                candidate, since = idle.pop()
+                if now - since < self.idle_timeout and candidate.sock is not None:
+                    connection = candidate
+                    self.stats_data["reused"] += 1
+                    break
+                candidate.close()
+            if connection is None:
+                self.stats_data["opened"] += 1
+        if connection is None:
+            scheme, host = key
+            if scheme == "https":
+                connection = http.client.HTTPSConnection(host, timeout=timeout, context=ssl.create_default_context())
+            else:
+                connection = http.client.HTTPConnection(host, timeout=timeout)
+        else:
+            connection.timeout = timeout
+            connection.sock.settimeout(timeout)
+        cancellation = None
+        if token is not None:
+            cancellation = (token, token.register(lambda: self.abort(connection)))
+        return (key, connection, semaphore, cancellation)
+
+    @staticmethod
+    def abort(connection):
+        """Shuts the socket of a connection down (from any thread), which unblocks the thread reading it"""
+        sock = connection.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def release(self, lease, reusable):
+        """Gives a connection back: kept for the next request if its response was read entirely, else closed"""
+        key, connection, semaphore, cancellation = lease
+        if cancellation is not None:
+            token, handle = cancellation
+            token.unregister(handle)
+            reusable = reusable and not token.cancelled  # The socket may have been shut down
+        if reusable and connection.sock is not None:
+            with self.lock:
+                self.idle.setdefault(key, []).append((connection, time.monotonic()))
+        else:
+            connection.close()
+        semaphore.release()
+
+    def open(self, request):
+        """
+        Sends a urllib request on a pooled connection (called by PooledHandler). Raises Cancelled if the
+        token of the current thread is cancelled before the response headers are received.
+        """
+        token = current_token()
+        if token is not None:
+            token.check()
+        key = (request.type, request.host)
+        timeout = request.timeout if request.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT else self.timeout
+        headers = dict(request.unredirected_hdrs)
+        headers.update(request.headers)
+        headers = {name.title(): value for name, value in headers.items()}
+        for attempt in range(2):
+            lease = self.acquire(key, timeout, token)
+            connection = lease[1]
+            reused = connection.sock is not None
+            try:
+                connection.request(request.get_method(), request.selector, request.data, headers)
+                return PooledResponse(self, lease, connection.getresponse(), request.get_full_url(), request.get_method())
+            except STALE_ERRORS as e:
+                self.release(lease, reusable=False)
+                if token is not None:
+                    token.check()  # The socket was shut down by the cancellation
+                if reused and attempt == 0:
+                    with self.lock:
+                        self.stats_data["retried"] += 1
+                    continue  # The host closed the idle connection, try a new one
+                self.count_error()
+                raise urllib.error.URLError(e)
+            except (OSError, http.client.HTTPException) as e:
+                self.release(lease, reusable=False)
+                if token is not None:
+                    token.check()
+                self.count_error()
+                raise urllib.error.URLError(e)
+
+    def count_error(self):
+        with self.lock:
+            self.stats_data["errors"] += 1
+
+    def stats(self):
+        """Pool statistics: requests, reused / opened connections, reuse rate, time spent waiting for a connection"""
+        with self.lock:
+            stats = dict(self.stats_data)
+            stats["idle"] = sum(len(connections) for connections in self.idle.values())
+            stats["hosts"] = len(self.limits)
+        stats["reuse_rate"] = stats["reused"] / stats["requests"] if stats["requests"] else 0.0
+        stats["mean_wait_seconds"] = stats["wait_seconds"] / stats["waits"] if stats["waits"] else 0.0
+        return stats
+
+
+# The client shared by the whole app
+client = HttpClient()
@@ -0,0 +1,135 @@
+"""
+A crash-safe, append-only journal of the queue, used to restore it when the app is launched again.
+
+Each change of the queue is appended to the journal file as one JSON line (a batch of changes is
+a single write), and synced to disk. Replaying the lines in order gives the queue as it was when
+the app closed or crashed: a line cut by a crash is ignored. The journal is compacted (rewritten
+atomically with one line per item) when it is loaded, and when it grows too much.
+"""
+
+import json
+import os
+from threading import Lock
+
+# The journal is compacted when it has this many more lines than live items
+COMPACT_THRESHOLD = 1000
+
+
+class JournalState():
+    """
+    The items described by the journal lines replayed so far, in queue order. Adding, updating and
+    swapping items is O(1), removing a batch of items rebuilds the order in one pass.
+    """
+
+    def __init__(self):
+        self.items = {}  # Key -> latest item
+        self.keys = []  # Keys of the items, in queue order
+        self.positions = {}  # Key -> index in keys
+
+    def __len__(self):
+        return len(self.items)
+
+    def values(self):
+        """The items, in queue order"""
+        return [self.items[key] for key in self.keys]
+
+    def apply(self, entry):
+        """Applies one journal line to the items"""
+        if entry["op"] == "put":
+            item = entry["item"]
+            if item["key"] not in self.items:
+                self.positions[item["key"]] = len(self.keys)
+                self.keys.append(item["key"])
+            self.items[item["key"]] = item
+        elif entry["op"] == "remove":
+            removed = [key for key in entry["keys"] if self.items.pop(key, None) is not None]
+            if removed:
+                self.keys = [key for key in self.keys if key in self.items]
+                self.positions = {key: index for index, key in enumerate(self.keys)}
+        elif entry["op"] == "swap":
+            key_a, key_b = entry["keys"]
+            if key_a in self.items and key_b in self.items:
+                a, b = self.positions[key_a], self.positions[key_b]
+                self.keys[a], self.keys[b] = key_b, key_a
+                self.positions[key_a], self.positions[key_b] = b, a
+
+
+class QueueJournal():
+    """
+    The journal of a queue. Items are dicts identified by their "key". Lines are:
+    {"op": "put", "item": {...}}  adds an item at the end of the queue, or updates it in place
+    {"op": "remove", "keys": [...]}  removes items
+    {"op": "swap", "keys": [a, b]}  exchanges the places of two items
+    """
+
+    def __init__(self, path):
+        self.path = path  # The journal file
+        self.state = JournalState()  # The items, as of the last line written
+        self.lines = 0  # Number of lines in the journal file
+        self.lock = Lock()  # Items can be updated by worker threads
+
+    def load(self):
+        """Replays the journal, compacts it and returns the items in queue order"""
+        state = JournalState()
+        try:
+            with open(self.path, "r") as file:
+                for line in file:
+                    try:
+                        state.apply(json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        continue  # A line cut by a crash
+        except OSError:
+            pass
+        with self.lock:
+            self.state = state
+            self.compact()
+            return self.state.values()
+
+    def put(self, items):
+        """Adds or updates a batch of items"""
+        self.write([{"op": "put", "item": item} for item in items])
+
+    def remove(self, keys):
+        """Removes a batch of items"""
+        if keys:
+            self.write([{"op": "remove", "keys": list(keys)}])
+
+    def swap(self, key_a, key_b):
+        """Records the exchange of two items, a line of two keys whatever the length of the queue"""
+        self.write([{"op": "swap", "keys": [key_a, key_b]}])
+
+    def write(self, entries):
+        """Appends the entries to the journal in one write, and syncs it to disk"""
+        if not entries:
+            return
+        with self.lock:
+            for entry in entries:
+                self.state.apply(entry)
+            if self.lines - len(self.state) > COMPACT_THRESHOLD:
+                self.compact()
+                return
+            data = "".join(json.dumps(entry) + "\n" for entry in entries)
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a") as file:
+                    file.write(data)
+                    file.flush()
+                    os.fsync(file.fileno())
+                self.lines += len(entries)
+            except OSError:
+                pass  # The queue still works, it just won't be restored
+
+    def compact(self):
+        """Atomically rewrites the journal with one line per item. Called with the lock held."""
+        tmp_path = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, "w") as file:
+                for item in self.state.values():
+                    file.write(json.dumps({"op": "put", "item": item}) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
+            self.lines = len(self.state)
+        except OSError:
+            pass
@@ -0,0 +1,166 @@
+"""
+A persistent cache of resolved video manifests (title and available streams), keyed by video id.
+
+Each manifest is stored in its own small json file, so that reading or adding one entry never
+rewrites the whole cache. Entries expire after a TTL, and the least recently used ones are
+evicted when the cache grows above its maximum size.
+"""
+
+import json
+import os
+import time
+import urllib.parse
+import urllib.request
+from threading import Lock
+
+from startup import LazyModule
+from streams import known_filesize
+
+# Imported on first use, importing pytube slows down the startup of the app
+helpers = LazyModule("pytube.helpers")
+
+# Stream urls are considered expired this many seconds before their expire parameter
+EXPIRY_MARGIN = 300
+
+
+def url_expiry(url):
+    """Returns the expiration timestamp of a signed stream url, or None if it doesn't have one"""
+    try:
+        return int(urllib.parse.parse_qs(urllib.parse.urlparse(url).query)["expire"][0])
+    except (KeyError, ValueError, IndexError):
+        return None
+
+
+def describe_stream(stream):
+    """Returns the cached description of a pytube Stream"""
+    # Don't trigger a HEAD request for every stream, the size is fetched lazily by CachedStream if unknown
+    filesize = known_filesize(stream)
+    return {"itag": stream.itag, "url": stream.url, "mime_type": stream.mime_type, "type": stream.type,
+            "subtype": stream.subtype, "codecs": list(stream.codecs), "is_progressive": stream.is_progressive,
+            "includes_audio_track": stream.includes_audio_track, "includes_video_track": stream.includes_video_track,
+            "resolution": stream.resolution, "abr": stream.abr, "fps": getattr(stream, "fps", None),
+            "filesize": filesize}
+
+
+def describe_youtube(youtube):
+    """Returns the manifest of a resolved YouTube object"""
+    streams = [describe_stream(stream) for stream in youtube.streams]
+    expiries = [url_expiry(stream["url"]) for stream in streams]
+    expiries = [expiry for expiry in expiries if expiry is not None]
+    return {"video_id": youtube.video_id, "title": youtube.title, "length": youtube.length,
+            "fetched": time.time(), "expires": min(expiries) if expiries else None, "streams": streams}
+
+
+class CachedStream():
+    """
+    A stream rebuilt from a cached manifest. It has the attributes of a pytube Stream used by
+    the app, and can be downloaded by the download engine while its url is valid.
+    """
+
+    def __init__(self, data, title):
+        self.itag = data["itag"]
+        self.url = data["url"]
+        self.mime_type = data["mime_type"]
+        self.type = data["type"]
+        self.subtype = data["subtype"]
+        self.codecs = data["codecs"]
+        self.is_progressive = data["is_progressive"]
+        self.is_adaptive = not self.is_progressive
+        self.includes_audio_track = data["includes_audio_track"]
+        self.includes_video_track = data["includes_video_track"]
+        self.resolution = data["resolution"]
+        self.abr = data["abr"]
+        self.fps = data["fps"]
+        self.title = title
+        self.user_data = None
+        self._filesize = data["filesize"]
+
+    @property
+    def filesize(self):
+        """File size of the stream in bytes (one HEAD request if it was not known when the manifest was cached)"""
+        if not self._filesize:
+            request = urllib.request.Request(self.url, method="HEAD", headers={"User-Agent": "Mozilla/5.0"})
+            with urllib.request.urlopen(request) as response:  # The timeout of the shared HTTP client
+                self._filesize = int(response.headers["content-length"])
+        return self._filesize
+
+    @property
+    def default_filename(self):
+        return f"{helpers.safe_filename(self.title)}.{self.subtype}"
+
+    def expired(self):
+        """True if the stream url has expired (or is about to)"""
+        expiry = url_expiry(self.url)
+        return expiry is not None and expiry - EXPIRY_MARGIN < time.time()
+
+    def get_file_path(self, filename=None, output_path=None, filename_prefix=None):
+        """Same file naming as pytube's Stream.get_file_path"""
+        if filename:
+            filename = f"{helpers.safe_filename(filename)}.{self.subtype}"
+        else:
+            filename = self.default_filename
+        if filename_prefix:
+            filename = f"{helpers.safe_filename(filename_prefix)}{filename}"
+        return os.path.join(helpers.target_directory(output_path), filename)
+
+
+class ManifestCache():
+    """An on-disk cache of manifests, with a time to live and a maximum number of entries"""
+
+    def __init__(self, directory, ttl=7*24*3600, max_entries=1000):
+        self.directory = directory  # One <video_id>.json file per manifest
+        self.ttl = ttl  # Age (in seconds) after which a manifest is not used anymore
+        self.max_entries = max(1, int(max_entries))  # Maximum number of cached manifests
+        self.lock = Lock()  # Mutex for writes and evictions
+
+    def path(self, video_id):
+        return os.path.join(self.directory, helpers.safe_filename(video_id) + ".json")
+
+    def get(self, video_id):
+        """Returns the cached manifest of a video, or None if it is unknown or too old"""
+        path = self.path(video_id)
+        try:
+            with open(path, "r") as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("fetched", 0) + self.ttl < time.time():
+            self.remove(video_id)
+            return None
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            pass
+        return manifest
+
+    def put(self, manifest):
+        """Stores (or replaces) the manifest of a video"""
+        path = self.path(manifest["video_id"])
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(manifest, file)
+            os.replace(tmp_path, path)
+            self.evict()
+
+    def remove(self, video_id):
+        try:
+            os.remove(self.path(video_id))
+        except OSError:
+            pass
+
+    def evict(self):
+        """Removes the least recently used manifests above the maximum size. Called with the lock held."""
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".json")]
+        except OSError:
+            return
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
@@ -0,0 +1,226 @@
+"""
+Timing and throughput metrics of the download pipeline: when each stage of an item started and
+ended and how many bytes it moved, and counters aggregated over every item (active transfers,
+bytes/s, failures and retries by exception type). They can be exported as a Prometheus textfile (for the
+node_exporter textfile collector) or as JSON lines.
+"""
+
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+
+# The stages of an item, in pipeline order
+STAGES = ("resolve", "video", "audio", "merge", "convert")
+# The download rate is averaged over this many seconds
+RATE_WINDOW = 5.0
+
+
+class ItemMetrics():
+    """
+    The stages of one item: stage -> {"start", "end", "seconds", "bytes"}. A stage run more than
+    once (streams resolved again) keeps its first start, and adds up its time and bytes.
+    """
+
+    def __init__(self):
+        self.created = time.time()  # When the item was queued
+        self.finished = None  # When the item was done or failed
+        self.stages = {}
+
+    def begin(self, stage):
+        record = self.stages.setdefault(stage, {"start": None, "end": None, "seconds": 0.0, "bytes": 0})
+        if record["start"] is None:
+            record["start"] = time.time()
+        record["running"] = time.perf_counter()
+        record["end"] = None
+        return record
+
+    def end(self, stage):
+        """Ends a stage, returns the seconds spent in it this time"""
+        record = self.stages[stage]
+        seconds = time.perf_counter() - record.pop("running")
+        record["seconds"] += seconds
+        record["end"] = time.time()
+        return seconds
+
+    def add(self, stage, nbytes):
+        """Counts bytes moved by a running stage"""
+        record = self.stages.get(stage)
+        if record is not None:
+            record["bytes"] += nbytes
+
+    def as_dict(self):
+        stages = {}
+        for stage, record in self.stages.items():
+            stages[stage] = {key: record[key] for key in ("start", "end", "seconds", "bytes")}
+            if "running" in record:
+                stages[stage]["seconds"] += time.perf_counter() - record["running"]
+        return {"created": self.created, "finished": self.finished, "stages": stages}
+
+    def summary(self):
+        """The stages as a short line of text, e.g. "resolve 0.4s, video 12.1s (25.3 MB)" """
+        parts = []
+        for stage, record in self.as_dict()["stages"].items():
+            text = f"{stage} {record['seconds']:.1f}s"
+            if record["bytes"]:
+                text += f" ({record['bytes'] / 1000000:.1f} MB)"
+            parts.append(text)
+        return ", ".join(parts)
+
+
+class Metrics():
+    """Counters aggregated over every item. Updated by the worker threads."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.started = time.time()
+        self.bytes = 0  # Bytes downloaded
+        self.active_transfers = 0  # Streams being downloaded
+        self.items = {"done": 0, "failed": 0}  # Finished items by result
+        self.failures = {}  # Exception type name -> count of failed items
+        self.retries = {}  # Exception type name -> count of failed attempts retried later
+        self.stage_seconds = {stage: 0.0 for stage in STAGES}  # Time spent in each stage
+        self.stage_bytes = {stage: 0 for stage in STAGES}  # Bytes moved by each stage
+        self.stage_runs = {stage: 0 for stage in STAGES}  # Number of times each stage ran
+        self.samples = deque()  # (time, bytes) over the last RATE_WINDOW seconds
+
+    @contextmanager
+    def stage(self, item, stage):
+        """Times a stage of an item. Yields the stage record, whose "bytes" can be set by the caller."""
+        record = item.begin(stage)
+        before = record["bytes"]
+        try:
+            yield record
+        finally:
+            seconds = item.end(stage)
+            with self.lock:
+                self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+                self.stage_bytes[stage] = self.stage_bytes.get(stage, 0) + record["bytes"] - before
+                self.stage_runs[stage] = self.stage_runs.get(stage, 0) + 1
+
+    @contextmanager
+    def transfer(self, item, stage):
+        """Times the download of a stream, counted as an active transfer meanwhile"""
+        with self.lock:
+            self.active_transfers += 1
+        try:
+            with self.stage(item, stage) as record:
+                yield record
+        finally:
+            with self.lock:
+                self.active_transfers -= 1
+
+    def add_bytes(self, nbytes):
+        now = time.perf_counter()
+        with self.lock:
+            self.bytes += nbytes
+            self.samples.append((now, self.bytes))
+            while self.samples and now - self.samples[0][0] > RATE_WINDOW:
+                self.samples.popleft()
+
+    def failure(self, error):
+        with self.lock:
+            name = type(error).__name__
+            self.failures[name] = self.failures.get(name, 0) + 1
+
+    def retry(self, error):
+        with self.lock:
+            name = type(error).__name__
+            self.retries[name] = self.retries.get(name, 0) + 1
+
+    def item_done(self, item, success):
+        item.finished = time.time()
+        with self.lock:
+            self.items["done" if success else "failed"] += 1
+
+    def rate(self):
+        """Download rate over the last RATE_WINDOW seconds, in bytes/s"""
+        now = time.perf_counter()
+        with self.lock:
+            samples = [sample for sample in self.samples if now - sample[0] <= RATE_WINDOW]
+            if not samples:
+                return 0.0
+            # The bytes counted by the first sample were downloaded before it
+            return (self.bytes - samples[0][1]) / max(now - samples[0][0], 1.0)
+
+    def snapshot(self, queue_depth=0, resolving=0):
+        """The counters as a dict. The queue figures are owned by the engine, which passes them."""
+        rate = self.rate()
+        with self.lock:
+            return {"time": time.time(), "uptime": time.time() - self.started, "bytes": self.bytes,
+                    "bytes_per_second": rate, "active_transfers": self.active_transfers,
+                    "queue_depth": queue_depth, "resolving": resolving, "items": dict(self.items),
+                    "failures": dict(self.failures), "retries": dict(self.retries),
+                    "stage_seconds": dict(self.stage_seconds),
+                    "stage_bytes": dict(self.stage_bytes), "stage_runs": dict(self.stage_runs)}
+
+
+def prometheus_text(snapshot):
+    """A snapshot in the Prometheus text exposition format"""
+    lines = []
+
+    def metric(name, kind, description, samples):
+        lines.append(f"# HELP ytgui_{name} {description}")
+        lines.append(f"# TYPE ytgui_{name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{escape_label(str(val))}"' for key, val in labels.items())
+            lines.append(f"ytgui_{name}{{{label_text}}} {value}" if label_text else f"ytgui_{name} {value}")
+
+    metric("downloaded_bytes_total", "counter", "Bytes downloaded.", [({}, snapshot["bytes"])])
+    metric("download_rate_bytes", "gauge", f"Download rate over the last {RATE_WINDOW:g} seconds, in bytes/s.",
+           [({}, f"{snapshot['bytes_per_second']:.1f}")])
+    metric("active_transfers", "gauge", "Streams being downloaded.", [({}, snapshot["active_transfers"])])
+    metric("queue_depth", "gauge", "Items waiting for a download slot.", [({}, snapshot["queue_depth"])])
+    metric("resolving", "gauge", "Urls being resolved or waiting to be.", [({}, snapshot["resolving"])])
+    metric("items_total", "counter", "Finished items by result.",
+           [({"result": result}, count) for result, count in snapshot["items"].items()])
+    metric("failures_total", "counter", "Failures by exception type.",
+           [({"type": name}, count) for name, count in sorted(snapshot["failures"].items())])
+    metric("retries_total", "counter", "Failed attempts retried later, by exception type.",
+           [({"type": name}, count) for name, count in sorted(snapshot["retries"].items())])
+    metric("stage_seconds_total", "counter", "Time spent in each stage of the pipeline.",
+           [({"stage": stage}, f"{seconds:.3f}") for stage, seconds in snapshot["stage_seconds"].items()])
+    metric("stage_bytes_total", "counter", "Bytes moved by each stage of the pipeline.",
+           [({"stage": stage}, count) for stage, count in snapshot["stage_bytes"].items()])
+    metric("stage_runs_total", "counter", "Number of times each stage of the pipeline ran.",
+           [({"stage": stage}, count) for stage, count in snapshot["stage_runs"].items()])
+    http = snapshot.get("http")
+    if http is not None:
+        metric("http_requests_total", "counter", "HTTP requests sent through the connection pool.", [({}, http["requests"])])
+        metric("http_connections_total", "counter", "Connections used by the HTTP requests, opened or reused.",
+               [({"connection": "opened"}, http["opened"]), ({"connection": "reused"}, http["reused"])])
+        metric("http_wait_seconds_total", "counter", "Time spent waiting for a free connection to a host.",
+               [({}, f"{http['wait_seconds']:.3f}")])
+        metric("http_idle_connections", "gauge", "Keep-alive connections waiting for a request.", [({}, http["idle"])])
+    return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def write_atomic(path, text):
+    """Writes a file at once, so that a collector never reads a partial export"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        file.write(text)
+    os.replace(tmp_path, path)
+
+
+def export(path, snapshot, items):
+    """
+    Exports the metrics to path: a Prometheus textfile if it ends with .prom, else JSON lines
+    (one {"type": "item", ...} line per item, then one {"type": "summary", ...} line).
+    items: the dicts describing each item (see DownloadEngine.item_metrics)
+    """
+    if path.endswith(".prom"):
+        text = prometheus_text(snapshot)
+    else:
+        lines = [json.dumps(dict(item, type="item")) for item in items]
+        lines.append(json.dumps(dict(snapshot, type="summary")))
+        text = "\n".join(lines) + "\n"
+    write_atomic(path, text)
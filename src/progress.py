@@ -0,0 +1,37 @@
+"""
+A thread-safe mailbox for the view updates published by the worker threads.
+"""
+
+from threading import Lock
+
+
+class ProgressBus():
+    """
+    Collects the row and status bar updates published by worker threads. Publishing never
+    waits on the GUI: updates are merged per item (only the latest value of each column is
+    kept), and the GUI thread drains them periodically to apply them in one batch.
+    """
+
+    def __init__(self):
+        self.updates = {}  # Item id -> {column: latest value}
+        self.message = None  # Latest status bar message
+        self.lock = Lock()  # Only held for the time of a dict update
+
+    def publish(self, vid_id, **columns):
+        """Records new column values for an item. None values are ignored."""
+        columns = {column: value for column, value in columns.items() if value is not None}
+        if columns:
+            with self.lock:
+                self.updates.setdefault(vid_id, {}).update(columns)
+
+    def post_message(self, message):
+        """Records a message for the status bar, replacing any message not displayed yet"""
+        with self.lock:
+            self.message = message
+
+    def drain(self):
+        """Returns the pending (updates, message) and resets them"""
+        with self.lock:
+            updates, message = self.updates, self.message
+            self.updates, self.message = {}, None
+        return updates, message
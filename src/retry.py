@@ -0,0 +1,50 @@
+"""
+Retry policy of the downloads: which failures are worth another attempt, and how long to wait
+before it. The delay doubles with every attempt, with random jitter so that the items failed by
+the same throttling do not all come back at the same time.
+"""
+
+import http.client
+import random
+import socket
+import urllib.error
+
+# HTTP statuses of expired (or not yet valid) stream urls: the video is resolved again before the next attempt
+EXPIRED_STATUSES = (403, 410)
+# HTTP statuses of throttling and temporary server errors
+THROTTLED_STATUSES = (408, 429, 500, 502, 503, 504)
+
+# Kinds of retryable failures
+EXPIRED = "expired"
+TRANSIENT = "transient"
+
+
+def classify(error):
+    """
+    The kind of a download failure: EXPIRED if the stream urls have to be resolved again, TRANSIENT
+    for throttling and network errors, None if another attempt would fail the same way.
+    """
+    if isinstance(error, urllib.error.HTTPError):
+        if error.code in EXPIRED_STATUSES:
+            return EXPIRED
+        return TRANSIENT if error.code in THROTTLED_STATUSES else None
+    if isinstance(error, urllib.error.URLError):
+        return TRANSIENT  # No response: connection refused or reset, DNS failure, timeout
+    if isinstance(error, (ConnectionError, socket.timeout, http.client.HTTPException)):
+        return TRANSIENT  # Connection closed or reset in the middle of a transfer
+    return None
+
+
+class RetryPolicy():
+    """The number of attempts of a download, and the exponential backoff between them"""
+
+    def __init__(self, attempts=4, delay=2.0, max_delay=60.0, jitter=0.5):
+        self.attempts = max(0, int(attempts))  # Retries after the first failure, 0 to never retry
+        self.delay = delay  # Delay before the first retry, in seconds
+        self.max_delay = max_delay  # Longest delay between two attempts, in seconds
+        self.jitter = jitter  # Up to this fraction of each delay is randomly taken off
+
+    def backoff(self, retry):
+        """The delay before a retry (counted from 0), in seconds: delay, then doubled for each retry"""
+        delay = min(self.max_delay, self.delay * 2 ** retry)
+        return delay * (1 - self.jitter * random.random())
@@ -0,0 +1,84 @@
+"""
+Helpers for a fast cold start: modules imported on first use (or preloaded in the background once
+the window is shown), and an optional trace of the startup timings (--startup-trace).
+"""
+
+import importlib
+import sys
+import time
+from contextlib import contextmanager
+from threading import Thread, Lock
+
+
+class StartupTrace():
+    """Prints the time elapsed since the start of the app at each step of the startup, if enabled"""
+
+    def __init__(self):
+        self.start = time.perf_counter()  # Reference time, reset by enable()
+        self.enabled = False
+        self.lock = Lock()  # Steps can be reported by background threads
+
+    def enable(self, start=None):
+        self.enabled = True
+        if start is not None:
+            self.start = start
+
+    def mark(self, label, duration=None):
+        """Reports a step. duration is the time spent in the step itself, in seconds."""
+        if not self.enabled:
+            return
+        elapsed = (time.perf_counter() - self.start) * 1000
+        line = f"[startup] {elapsed:8.1f} ms  {label}"
+        if duration is not None:
+            line += f" ({duration * 1000:.1f} ms)"
+        with self.lock:
+            print(line, file=sys.stderr, flush=True)
+
+    @contextmanager
+    def timed(self, label):
+        """Reports a step once the enclosed block has run, with its duration"""
+        start = time.perf_counter()
+        yield
+        self.mark(label, time.perf_counter() - start)
+
+
+# The trace of the current process
+trace = StartupTrace()
+
+
+class LazyModule():
+    """
+    Stands for a module that is only imported when one of its attributes is first used,
+    so that importing it does not slow down the startup of the app.
+    """
+
+    def __init__(self, name):
+        self._name = name  # Full name of the module
+        self._module = None  # The module, once imported
+        self._lock = Lock()  # Only one thread imports the module
+
+    def load(self):
+        """Imports the module if needed, and returns it"""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    with trace.timed(f"import {self._name}"):
+                        self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self.load(), attribute)
+
+
+def preload(*modules):
+    """Imports lazy modules in a background thread, so that they are ready when first used"""
+    def load():
+        for module in modules:
+            try:
+                module.load()
+            except ImportError:
+                pass  # Reported when the module is actually used
+        trace.mark("background imports done")
+    thread = Thread(target=load, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,169 @@
+"""
+Stream selection: an index of the streams of a video built once when it is loaded, and the
+quality presets used to pick the streams of many queued videos automatically.
+"""
+
+import urllib.parse
+
+
+def stream_rank(value: str):
+    """The number in a resolution or bitrate string ("720p", "128kbps"), used to sort streams"""
+    digits = "".join(c for c in str(value) if c.isdigit())
+    return int(digits) if digits else 0
+
+
+def known_filesize(stream):
+    """The size of a stream if it is known without any request (cached, or in the url), else None"""
+    filesize = getattr(stream, "_filesize", None)
+    if filesize:
+        return filesize
+    try:
+        return int(urllib.parse.parse_qs(urllib.parse.urlparse(stream.url).query)["clen"][0])
+    except (KeyError, ValueError, IndexError):
+        return None
+
+
+class StreamIndex():
+    """
+    The streams of a video indexed by (is_progressive, type, subtype, resolution, abr), with the
+    lists the user chooses from sorted once: switching between progressive / adaptive or audio
+    only is then a lookup instead of filtering and sorting every stream again.
+    """
+
+    def __init__(self, streams):
+        self.keys = {}  # (is_progressive, type, subtype, resolution, abr) -> streams
+        for stream in streams:
+            key = (stream.is_progressive, stream.type, stream.subtype, stream.resolution, stream.abr)
+            self.keys.setdefault(key, []).append(stream)
+
+        # Video streams the user can choose from, best first, by is_progressive
+        self.video = {True: [], False: []}
+        # Audio streams the user can choose from, best first, by only_audio
+        self.audio = {True: [], False: []}
+        for (is_progressive, kind, subtype, resolution, abr), matching in self.keys.items():
+            if kind == "audio" and subtype == "webm" and abr:
+                # Opus audio (itags 249 to 251), only for audio downloads: copied into ogg files (see conversion.py)
+                self.audio[True].extend(matching)
+            if subtype != "mp4":
+                continue
+            if kind == "video" and resolution:
+                self.video[is_progressive].extend(matching)
+            if abr:
+                self.audio[False].extend(matching)
+                self.audio[True].extend(s for s in matching if s.includes_audio_track and not s.includes_video_track)
+        for key in self.video:
+            self.video[key].sort(key=lambda s: stream_rank(s.resolution), reverse=True)
+        for key in self.audio:
+            self.audio[key].sort(key=lambda s: stream_rank(s.abr), reverse=True)
+
+    def find(self, is_progressive=None, type=None, subtype=None, resolution=None, abr=None):
+        """The streams matching every given field"""
+        query = (is_progressive, type, subtype, resolution, abr)
+        return [stream for key, streams in self.keys.items()
+                if all(wanted is None or wanted == value for wanted, value in zip(query, key))
+                for stream in streams]
+
+
+class QualityPreset():
+    """
+    A rule choosing the streams of a video, written as a few words, for instance
+    "adaptive <=1080p <=500MB" (the best adaptive streams up to 1080p, with a total size under 500 MB):
+    progressive | adaptive | audio   the kind of streams
+    <=1080p  >=480p                  bounds on the video resolution
+    <=500MB  (or kB, GB)             size limit: the best streams under it, else the smallest ones
+    best | smallest                  quality preference (best by default)
+    """
+
+    UNITS = {"kb": 1000, "mb": 1000000, "gb": 1000000000}
+
+    def __init__(self, progressive=True, only_audio=False, max_resolution=None, min_resolution=None,
+                 max_size=None, best=True):
+        self.progressive = progressive and not only_audio  # Progressive or adaptive video streams
+        self.only_audio = only_audio  # Audio only
+        self.max_resolution = max_resolution  # Highest video resolution (lines), None for no limit
+        self.min_resolution = min_resolution  # Lowest video resolution (lines), None for no limit
+        self.max_size = max_size  # Largest total size in bytes, None for no limit
+        self.best = best  # Prefer the best quality (else the smallest files)
+
+    @classmethod
+    def parse(cls, text):
+        """Builds a preset from its description. Raises ValueError if it is not valid."""
+        preset = cls()
+        for word in text.lower().split():
+            if word in ("progressive", "adaptive"):
+                preset.progressive = word == "progressive"
+            elif word == "audio":
+                preset.only_audio = True
+            elif word in ("best", "smallest"):
+                preset.best = word == "best"
+            elif word.startswith(("<=", ">=")) and word.endswith("p"):
+                value = int(word[2:-1])
+                if word.startswith("<="):
+                    preset.max_resolution = value
+                else:
+                    preset.min_resolution = value
+            elif word.startswith("<=") and word[-2:] in cls.UNITS:
+                preset.max_size = int(float(word[2:-2]) * cls.UNITS[word[-2:]])
+            else:
+                raise ValueError(f"Unknown quality rule: {word}")
+        if preset.only_audio:
+            preset.progressive = False
+        return preset
+
+    def __str__(self):
+        words = ["audio" if self.only_audio else "progressive" if self.progressive else "adaptive"]
+        if self.max_resolution:
+            words.append(f"<={self.max_resolution}p")
+        if self.min_resolution:
+            words.append(f">={self.min_resolution}p")
+        if self.max_size:
+            words.append(f"<={self.max_size / 1000000:g}MB")
+        if not self.best:
+            words.append("smallest")
+        return " ".join(words)
+
+    def candidates(self, vid):
+        """The (video index, audio index) choices for an item, in order of preference"""
+        vindices = [i for i, s in enumerate(vid.vstreams)
+                    if (self.max_resolution is None or stream_rank(s.resolution) <= self.max_resolution)
+                    and (self.min_resolution is None or stream_rank(s.resolution) >= self.min_resolution)]
+        if not vindices:
+            vindices = list(range(len(vid.vstreams)))  # Nothing in the bounds, any resolution is better than none
+        aindices = list(range(len(vid.astreams)))
+        if not self.best:
+            vindices.reverse()
+            aindices.reverse()
+        if self.only_audio:
+            return [(0, a) for a in aindices]
+        if self.progressive:
+            return [(v, 0) for v in vindices]
+        return [(v, a) for v in vindices for a in aindices]
+
+    def size(self, vid, choice):
+        """Total size of a choice, None if it is not known without a request"""
+        v, a = choice
+        streams = []
+        if self.only_audio or not self.progressive:
+            streams.append(vid.astreams[a])
+        if not self.only_audio:
+            streams.append(vid.vstreams[v])
+        sizes = [known_filesize(stream) for stream in streams]
+        return None if None in sizes else sum(sizes)
+
+    def apply(self, vid):
+        """Selects the streams of a loaded item. Returns False if the item has no matching stream."""
+        vid.only_audio = self.only_audio
+        vid.update_stream_type(self.progressive)
+        choices = self.candidates(vid)
+        if not choices or (not vid.astreams and (self.only_audio or not self.progressive)) \
+                or (not vid.vstreams and not self.only_audio):
+            return False
+        if self.max_size is not None:
+            sized = [(choice, self.size(vid, choice)) for choice in choices]
+            fitting = [choice for choice, size in sized if size is None or size <= self.max_size]
+            if fitting:
+                choices = fitting
+            else:
+                choices = [min(sized, key=lambda item: item[1])[0]]
+        vid.selected_vstream, vid.selected_astream = choices[0]
+        return True
@@ -0,0 +1,168 @@
+"""
+Helpers to run ffmpeg: progress reporting, and feeding downloaded data to it without writing it to disk first.
+"""
+
+import os
+import tempfile
+import time
+import uuid
+
+if os.name == "nt":
+    import _winapi
+    import ctypes
+
+# Size of the named pipe buffers on Windows
+PIPE_BUFFER_SIZE = 1024 * 1024
+# Delay between two attempts to open a fifo that has no reader yet
+OPEN_POLL_INTERVAL = 0.05
+# Windows error raised by ConnectNamedPipe if the reader connected first
+ERROR_PIPE_CONNECTED = 535
+
+
+def parse_speed(value):
+    """Converts an ffmpeg speed ("1.5x") to a float, or None if it is not available yet"""
+    try:
+        return float(value.rstrip("x"))
+    except (AttributeError, ValueError):
+        return None
+
+
+class FFmpegProgress():
+    """
+    Parser for the machine readable output of ffmpeg's -progress option: blocks of key=value
+    lines, each ending with a progress=continue (or progress=end) line. Only the current block
+    is kept in memory.
+    """
+
+    def __init__(self):
+        self.block = {}  # The key/values of the block being read
+
+    def feed(self, line):
+        """Parses one line. Returns the report of the block once its last line has been read, else None."""
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return None
+        self.block[key.strip()] = value.strip()
+        if key.strip() != "progress":
+            return None
+        block, self.block = self.block, {}
+        return self.report(block)
+
+    @staticmethod
+    def report(block):
+        """
+        Extracts the useful values of a block:
+        out_time: position in the output, in seconds
+        speed: processing speed relative to real time (None if unknown)
+        bitrate: output bitrate, as written by ffmpeg ("128.0kbits/s")
+        total_size: bytes written to the output so far
+        end: True for the last block
+        """
+        out_time = 0.0
+        try:
+            out_time = int(block.get("out_time_us", block.get("out_time_ms", "0"))) / 1000000
+        except ValueError:
+            pass  # N/A before the first frame
+        try:
+            total_size = int(block.get("total_size", "0"))
+        except ValueError:
+            total_size = 0
+        return {"out_time": max(out_time, 0.0), "speed": parse_speed(block.get("speed")),
+                "bitrate": block.get("bitrate", "N/A"), "total_size": total_size,
+                "end": block.get("progress") == "end"}
+
+
+class NamedPipe():
+    """
+    A named pipe (a fifo on posix systems) that ffmpeg can open as an input file while
+    python writes to it. Use its path in the ffmpeg command, then open() and write() from
+    another thread. abort() unblocks the writer if ffmpeg exits without reading everything.
+    """
+
+    def __init__(self, name="input"):
+        self.aborted = False  # True once the reader is gone
+        self.handle = None  # Pipe handle (Windows) or file descriptor (posix) of the writing end
+        if os.name == "nt":
+            self.dir = None
+            self.path = rf"\\.\pipe\ytgui-{name}-{uuid.uuid4().hex}"
+            self.server = _winapi.CreateNamedPipe(
+                self.path, _winapi.PIPE_ACCESS_DUPLEX, _winapi.PIPE_WAIT, 1,
+                PIPE_BUFFER_SIZE, PIPE_BUFFER_SIZE, _winapi.NMPWAIT_WAIT_FOREVER, _winapi.NULL)
+        else:
+            self.dir = tempfile.mkdtemp(prefix="ytgui-")
+            self.path = os.path.join(self.dir, name)
+            os.mkfifo(self.path)
+
+    def open(self):
+        """Waits until the reader has opened the pipe. Raises BrokenPipeError if the pipe was aborted."""
+        if os.name == "nt":
+            try:
+                _winapi.ConnectNamedPipe(self.server, False)
+            except OSError as e:
+                if e.winerror != ERROR_PIPE_CONNECTED:
+                    raise
+            self.handle = self.server
+        else:
+            # Opening a fifo blocks until there is a reader, so poll with O_NONBLOCK to be able to abort
+            while self.handle is None:
+                if self.aborted:
+                    break
+                try:
+                    self.handle = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+                except OSError:
+                    time.sleep(OPEN_POLL_INTERVAL)
+            if self.handle is not None:
+                os.set_blocking(self.handle, True)
+        if self.aborted:
+            raise BrokenPipeError(f"The reader of {self.path} has exited")
+
+    def write(self, data):
+        """Writes all of data to the pipe, blocking while the reader is busy"""
+        view = memoryview(data)
+        while view:
+            if os.name == "nt":
+                written, _ = _winapi.WriteFile(self.handle, view, False)
+            else:
+                written = os.write(self.handle, view)
+            view = view[written:]
+
+    def close(self):
+        """Closes the writing end, the reader gets an end of file once it has read everything"""
+        if self.handle is None:
+            return
+        try:
+            if os.name == "nt":
+                ctypes.windll.kernel32.FlushFileBuffers(self.handle)
+                _winapi.CloseHandle(self.handle)
+            else:
+                os.close(self.handle)
+        except OSError:
+            pass
+        self.handle = None
+
+    def abort(self):
+        """Unblocks a writer waiting in open() once the reader is gone"""
+        self.aborted = True
+        if os.name == "nt":
+            # Connect a dummy reader so that ConnectNamedPipe returns
+            try:
+                _winapi.CloseHandle(_winapi.CreateFile(self.path, _winapi.GENERIC_READ, 0, _winapi.NULL,
+                                                       _winapi.OPEN_EXISTING, 0, _winapi.NULL))
+            except OSError:
+                pass
+
+    def remove(self):
+        """Closes the pipe and removes it from the filesystem"""
+        if os.name == "nt":
+            if self.handle is None:
+                try:
+                    _winapi.CloseHandle(self.server)
+                except OSError:
+                    pass
+        else:
+            try:
+                os.remove(self.path)
+                os.rmdir(self.dir)
+            except OSError:
+                pass
+        self.close()
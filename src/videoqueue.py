@@ -0,0 +1,89 @@
+"""
+The model behind the queue view: an ordered list of VideoData indexed by their id.
+"""
+
+from threading import Lock
+
+
+class VideoQueue():
+    """
+    An ordered collection of VideoData items, mirroring the rows of the queue view.
+
+    Items are looked up by their id (the stable handle kept by worker threads) in O(1),
+    and so is their current row. Removing any number of items rebuilds the row index in a
+    single pass. The queue is only modified by the GUI thread.
+
+    If a journal is attached (see journal.py), every change is recorded in it so that the
+    queue can be restored when the app is launched again. Worker threads record the items
+    they update: changes and their journal lines are made under a lock, so that an item
+    removed meanwhile is not written back.
+    """
+
+    def __init__(self):
+        self.items = []  # The items, in row order
+        self.index = {}  # Item id -> item
+        self.rows = {}  # Item id -> current row
+        self.journal = None  # Optional QueueJournal recording the changes
+        self.lock = Lock()  # Mutex for the changes recorded in the journal
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __getitem__(self, row):
+        return self.items[row]
+
+    def append(self, vid):
+        """Adds an item at the end of the queue, returns its row"""
+        self.extend([vid])
+        return self.rows[vid.id]
+
+    def extend(self, vids):
+        """Adds a batch of items at the end of the queue"""
+        with self.lock:
+            for vid in vids:
+                self.rows[vid.id] = len(self.items)
+                self.index[vid.id] = vid
+                self.items.append(vid)
+            if self.journal is not None:
+                self.journal.put([vid.record() for vid in vids])
+
+    def save(self, vids):
+        """Records the current state of the given items in the journal, unless they have been removed (any thread)"""
+        if self.journal is None:
+            return
+        with self.lock:
+            self.journal.put([vid.record() for vid in vids if vid.id in self.index])
+
+    def get(self, vid_id):
+        """Returns the item with the given id, or None if it is not in the queue anymore"""
+        return self.index.get(vid_id)
+
+    def row(self, vid):
+        """Returns the current row of an item, or None if it is not in the queue anymore"""
+        return self.rows.get(vid.id)
+
+    def swap(self, row_a, row_b):
+        """Exchanges the items at two rows"""
+        items = self.items
+        with self.lock:
+            items[row_a], items[row_b] = items[row_b], items[row_a]
+            self.rows[items[row_a].id] = row_a
+            self.rows[items[row_b].id] = row_b
+            if self.journal is not None:
+                self.journal.swap(items[row_a].key, items[row_b].key)
+
+    def remove_rows(self, rows):
+        """Removes the items at the given rows in one pass, returns the removed items"""
+        rows = set(rows)
+        with self.lock:
+            removed = [vid for row, vid in enumerate(self.items) if row in rows]
+            self.items = [vid for row, vid in enumerate(self.items) if row not in rows]
+            for vid in removed:
+                del self.index[vid.id]
+            self.rows = {vid.id: row for row, vid in enumerate(self.items)}
+            if self.journal is not None:
+                self.journal.remove([vid.key for vid in removed])
+        return removed
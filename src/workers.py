@@ -0,0 +1,194 @@
+"""
+The schedulers of the engine: urls waiting to be resolved, items waiting for a download slot and
+downloaded files waiting to be merged / converted. They run on the event loop of the engine (see
+eventloop.py): a waiting item is an entry in a queue, and only takes a thread from the pool of the
+loop while its blocking work runs. Coroutine targets (ffmpeg jobs) do not take a thread at all.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import traceback
+from collections import deque
+from threading import Lock
+
+
+async def run_job(events, target, item):
+    """Runs target(item): awaited on the loop if it is a coroutine function, else in the pool of threads"""
+    if asyncio.iscoroutinefunction(target):
+        return await target(item)
+    return await events.blocking(target, item)
+
+
+class ResolverPool():
+    """A bounded pool consuming a queue of pending items (urls waiting to be resolved)"""
+
+    def __init__(self, events, target, workers=4):
+        self.events = events  # The event loop running the items (see eventloop.py)
+        self.target = target  # Function (or coroutine function) called for each pending item
+        self.workers = max(1, int(workers))  # Maximum number of items processed at the same time
+        self.pending = deque()  # Items waiting for a free worker
+        self.active = 0  # Number of items currently being processed
+        self.lock = Lock()  # Mutex for the pending queue and active counter
+
+    def submit(self, item):
+        """Add an item to the pending queue"""
+        self.submit_many([item])
+
+    def submit_many(self, items):
+        """Add a batch of items to the pending queue, in order (any thread)"""
+        with self.lock:
+            self.pending.extend(items)
+        self.events.call(self._fill)
+
+    def set_workers(self, workers):
+        """Changes the number of items processed at the same time. Items above a lowered limit finish normally."""
+        with self.lock:
+            self.workers = max(1, int(workers))
+        self.events.call(self._fill)
+
+    def clear(self):
+        """Drops the pending items, returns them"""
+        with self.lock:
+            items, self.pending = list(self.pending), deque()
+        return items
+
+    def busy(self):
+        """Number of items that are either pending or being processed"""
+        with self.lock:
+            return self.active + len(self.pending)
+
+    def _fill(self):
+        """Start pending items until the limit is reached (loop thread)"""
+        with self.lock:
+            while self.pending and self.active < self.workers:
+                item = self.pending.popleft()
+                self.active += 1
+                self.events.loop.create_task(self._run(item))
+
+    async def _run(self, item):
+        try:
+            await run_job(self.events, self.target, item)
+        except asyncio.CancelledError:
+            raise  # The engine is closing (an Exception before Python 3.8)
+        except Exception:
+            traceback.print_exc()  # The targets report their errors, this is a bug: a failing item must not stop the pool
+        finally:
+            with self.lock:
+                self.active -= 1
+            self._fill()
+
+
+class TranscodePool(ResolverPool):
+    """
+    The pool running the merge / conversion jobs of downloaded items. ffmpeg is CPU-bound, so the pool
+    is sized to the number of CPUs by default: more jobs at once would only compete for the cores.
+    """
+
+    def __init__(self, events, target, workers=0):
+        super().__init__(events, target, workers or os.cpu_count() or 1)
+
+    def set_workers(self, workers):
+        """Changes the number of jobs run at the same time (0 for the number of CPUs)"""
+        super().set_workers(workers or os.cpu_count() or 1)
+
+
+class DownloadScheduler():
+    """
+    Runs submitted items with a global concurrency limit. Waiting items are started in
+    priority order (lowest key first) every time a slot frees up, so a steady number of
+    transfers stays in flight until nothing is left to run.
+
+    Waiting items are kept in a heap with the priority they had when they were submitted. Removing
+    an item or changing its priority leaves its old heap entry behind, skipped when it comes up, so
+    every operation stays O(log n) however many items are waiting.
+    """
+
+    def __init__(self, events, target, key, limit=3):
+        self.events = events  # The event loop running the items (see eventloop.py)
+        self.target = target  # Function running one item (blocking), run in the pool of threads
+        self.key = key  # Function returning the priority of an item (lowest runs first)
+        self.limit = max(1, int(limit))  # Maximum number of items running at the same time
+        self.waiting = {}  # Item waiting for a free slot -> its current priority
+        self.heap = []  # (priority, sequence, item) entries of the waiting items, possibly outdated
+        self.sequence = itertools.count()  # Tie-breaker keeping the submission order of equal priorities
+        self.running = set()  # Items currently running
+        self.paused = False  # True if no new item should be started
+        self.lock = Lock()  # Mutex for the waiting / running items
+
+    def submit(self, item):
+        """Add an item to the waiting list, it is started as soon as a slot is free (any thread)"""
+        with self.lock:
+            if item not in self.waiting and item not in self.running:
+                self._push(item)
+        self.events.call(self._fill)
+
+    def reprioritize(self, items):
+        """Updates the priority of waiting items, after their key has changed (items moved in the queue)"""
+        with self.lock:
+            for item in items:
+                if item in self.waiting:
+                    self._push(item)
+
+    def remove(self, item):
+        """Remove an item that has not started yet. Returns False if it is not waiting."""
+        with self.lock:
+            return self.waiting.pop(item, None) is not None
+
+    def is_waiting(self, item):
+        with self.lock:
+            return item in self.waiting
+
+    def pause(self):
+        """Stop starting new items (running items are not interrupted)"""
+        with self.lock:
+            self.paused = True
+
+    def resume(self):
+        """Start waiting items again"""
+        with self.lock:
+            self.paused = False
+        self.events.call(self._fill)
+
+    def set_limit(self, limit):
+        """Change the concurrency limit. Running items above a lowered limit finish normally."""
+        with self.lock:
+            self.limit = max(1, int(limit))
+        self.events.call(self._fill)
+
+    def counts(self):
+        """Returns the number of (running, waiting) items"""
+        with self.lock:
+            return len(self.running), len(self.waiting)
+
+    def _push(self, item):
+        """Records the current priority of a waiting item. Must be called with the lock held."""
+        priority = self.key(item)
+        self.waiting[item] = priority
+        heapq.heappush(self.heap, (priority, next(self.sequence), item))
+
+    def _fill(self):
+        """Start waiting items until the limit is reached (loop thread)"""
+        with self.lock:
+            while not self.paused and self.waiting and len(self.running) < self.limit:
+                priority, _, item = heapq.heappop(self.heap)
+                if self.waiting.get(item) != priority:
+                    continue  # Removed, or submitted again with another priority
+                del self.waiting[item]
+                self.running.add(item)
+                self.events.loop.create_task(self._run(item))
+            if not self.waiting:
+                self.heap = []  # Only outdated entries are left
+
+    async def _run(self, item):
+        try:
+            await run_job(self.events, self.target, item)
+        except asyncio.CancelledError:
+            raise  # The engine is closing (an Exception before Python 3.8)
+        except Exception:
+            traceback.print_exc()  # The targets report their errors, this is a bug: a failing item must not stop the scheduler
+        finally:
+            with self.lock:
+                self.running.discard(item)
+            self._fill()